@@ -0,0 +1,44 @@
+import argparse
+import json
+
+# prints the change of every metric between two benchmarks.endpoints results:
+# python3 -m benchmarks.compare before.json after.json
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps", "rpcs_per_request"]
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return "n/a"
+    if before == 0:
+        return f"{after - before:+.2f}"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before = json.load(before_file)
+        after = json.load(after_file)
+
+    print(f"before {before.get('commit')}  after {after.get('commit')}")
+    print(f"{'scenario':<30}" + "".join(f"{metric:>20}" for metric in METRICS))
+    for name, after_result in after["results"].items():
+        before_result = before["results"].get(name)
+        if before_result is None:
+            continue
+        print(
+            f"{name:<30}"
+            + "".join(
+                f"{_change(before_result.get(metric), after_result.get(metric)):>20}"
+                for metric in METRICS
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# drives every endpoint of the products and shop blueprints against seeded data
+# and writes latency percentiles, throughput and firestore rpcs per request to a
+# json file that benchmarks.compare can diff across commits, run with:
+# python3 -m benchmarks.endpoints --shops 10 --products 100 --output results.json
+# add --gunicorn to go through a real gunicorn process instead of the test client
+
+
+class TestClientDriver:
+    name = "test-client"
+
+    def __init__(self):
+        from src.app import app
+
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        from src.documents import rpc_count
+
+        # test clients keep the request context around, one per thread
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        with self.local.client as client:
+            response = client.open(path, method=method, json=body)
+            return response.status_code, response.data, rpc_count()
+
+    def rpcs(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class GunicornDriver:
+    name = "gunicorn"
+
+    def __init__(self, workers, threads):
+        import requests
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "--workers",
+                str(workers),
+                "--threads",
+                str(threads),
+                "--bind",
+                f"127.0.0.1:{port}",
+                "src.app:app",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.session = requests.Session()
+        for _ in range(100):
+            try:
+                self.session.get(f"{self.base_url}/healthz", timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+
+    def request(self, method, path, body=None):
+        response = self.session.request(method, f"{self.base_url}{path}", json=body)
+        return response.status_code, response.content, None
+
+    # total firestore rpcs and requests per route, summed over every worker
+    # that served a /metrics scrape, good enough with a single worker
+    def rpcs(self):
+        text = self.session.get(f"{self.base_url}/metrics").text
+        totals = {}
+        for kind, method, route, value in re.findall(
+            r'firestore_request_rpcs_(sum|count)\{method="(\w+)",route="([^"]+)"\} (\S+)',
+            text,
+        ):
+            totals.setdefault((method, route), {})[kind] = float(value)
+        return totals
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Scenario:
+    # prepare runs untimed and returns one argument per request, so endpoints
+    # that consume their target (deletes, adding to a shop) get fresh ones
+    def __init__(self, name, method, route, path, body=None, prepare=None):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.path = path
+        self.body = body
+        self.prepare = prepare
+
+
+def _product(index):
+    return {
+        "name": f"product {index}",
+        "description": "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=100)),
+        "price": random.randint(1, 100),
+    }
+
+
+def _create_products(driver, count):
+    ids = []
+    for start in range(0, count, 500):
+        _, data, _ = driver.request(
+            "POST",
+            "/products/batch",
+            [_product(index) for index in range(start, min(count, start + 500))],
+        )
+        ids.extend(result["id"] for result in json.loads(data))
+    return ids
+
+
+def _create_shop(driver, index):
+    _, data, _ = driver.request(
+        "POST", "/shop/", {"name": f"shop {index}", "address": f"{index} high street"}
+    )
+    return json.loads(data)["id"]
+
+
+def _stock_shop(driver, shop_id, product_ids):
+    for start in range(0, len(product_ids), 500):
+        driver.request(
+            "POST",
+            f"/shop/{shop_id}/products/batch",
+            [
+                {"product_id": product_id, "quantity": random.randint(1, 10)}
+                for product_id in product_ids[start : start + 500]
+            ],
+        )
+
+
+def seed(driver, shops, products):
+    product_ids = _create_products(driver, products)
+    shop_ids = [_create_shop(driver, index) for index in range(shops)]
+    for shop_id in shop_ids:
+        _stock_shop(driver, shop_id, product_ids)
+    return {"product_ids": product_ids, "shop_ids": shop_ids}
+
+
+def scenarios(data):
+    product = lambda _: random.choice(data["product_ids"])
+    shop = lambda _: random.choice(data["shop_ids"])
+
+    def fresh_products(driver, count):
+        return _create_products(driver, count)
+
+    def fresh_shops(driver, count):
+        shop_ids = [_create_shop(driver, index) for index in range(count)]
+        for shop_id in shop_ids:
+            _stock_shop(driver, shop_id, data["product_ids"][:10])
+        return shop_ids
+
+    def unstocked(driver, count):
+        return [
+            (random.choice(data["shop_ids"]), product_id)
+            for product_id in _create_products(driver, count)
+        ]
+
+    def stocked(driver, count):
+        pairs = unstocked(driver, count)
+        for shop_id, product_id in pairs:
+            driver.request("POST", f"/shop/{shop_id}/products/{product_id}", {})
+        return pairs
+
+    def empty_shops(driver, count):
+        return [_create_shop(driver, index) for index in range(count)]
+
+    def deleted_shops(driver, count):
+        shop_ids = fresh_shops(driver, count)
+        for shop_id in shop_ids:
+            driver.request("DELETE", f"/shop/{shop_id}?background=1")
+        return shop_ids
+
+    def sample(count):
+        return random.sample(data["product_ids"], min(count, len(data["product_ids"])))
+
+    return [
+        Scenario("list products", "GET", "/products/", lambda _: "/products/"),
+        Scenario(
+            "list products by price",
+            "GET",
+            "/products/",
+            lambda _: "/products/?min_price=20&max_price=40",
+        ),
+        Scenario("page products", "GET", "/products/", lambda _: "/products/?limit=50"),
+        Scenario(
+            "lookup products",
+            "GET",
+            "/products/",
+            lambda _: "/products/?ids=" + ",".join(sample(50)),
+        ),
+        Scenario(
+            "lookup products by post",
+            "POST",
+            "/products/lookup",
+            lambda _: "/products/lookup",
+            lambda _: {"ids": sample(50)},
+        ),
+        Scenario(
+            "product stats",
+            "GET",
+            "/products/stats",
+            lambda _: "/products/stats?min_price=20&max_price=40",
+        ),
+        Scenario(
+            "shops stocking product",
+            "GET",
+            "/products/<product_id>/shops",
+            lambda _: f"/products/{product(_)}/shops",
+        ),
+        Scenario(
+            "search shop products",
+            "GET",
+            "/shop-products/",
+            lambda _: "/shop-products/?min_price=20&max_price=40&limit=50",
+        ),
+        Scenario(
+            "create product", "POST", "/products/", lambda _: "/products/", _product
+        ),
+        Scenario(
+            "create products batch",
+            "POST",
+            "/products/batch",
+            lambda _: "/products/batch",
+            lambda _: [_product(index) for index in range(100)],
+        ),
+        Scenario(
+            "get product",
+            "GET",
+            "/products/<product_id>",
+            lambda _: f"/products/{product(_)}",
+        ),
+        Scenario(
+            "update product",
+            "PUT",
+            "/products/<product_id>",
+            lambda _: f"/products/{product(_)}",
+            lambda _: {"price": random.randint(1, 100)},
+        ),
+        Scenario(
+            "delete product",
+            "DELETE",
+            "/products/<product_id>",
+            lambda product_id: f"/products/{product_id}",
+            prepare=fresh_products,
+        ),
+        Scenario("list shops", "GET", "/shop/", lambda _: "/shop/"),
+        Scenario(
+            "create shop",
+            "POST",
+            "/shop/",
+            lambda _: "/shop/",
+            lambda _: {"name": "shop", "address": "high street"},
+        ),
+        Scenario("get shop", "GET", "/shop/<shop_id>", lambda _: f"/shop/{shop(_)}"),
+        Scenario(
+            "update shop",
+            "PUT",
+            "/shop/<shop_id>",
+            lambda _: f"/shop/{shop(_)}",
+            lambda _: {"address": f"{random.randint(1, 100)} high street"},
+        ),
+        Scenario(
+            "delete shop",
+            "DELETE",
+            "/shop/<shop_id>",
+            lambda shop_id: f"/shop/{shop_id}",
+            prepare=fresh_shops,
+        ),
+        Scenario(
+            "list shop products",
+            "GET",
+            "/shop/<shop_id>/products",
+            lambda _: f"/shop/{shop(_)}/products",
+        ),
+        Scenario(
+            "list shop products by price",
+            "GET",
+            "/shop/<shop_id>/products",
+            lambda _: f"/shop/{shop(_)}/products?min_price=20&max_price=40",
+        ),
+        Scenario(
+            "shop product stats",
+            "GET",
+            "/shop/<shop_id>/products/stats",
+            lambda _: f"/shop/{shop(_)}/products/stats?min_price=20&max_price=40",
+        ),
+        Scenario(
+            "add products to shop batch",
+            "POST",
+            "/shop/<shop_id>/products/batch",
+            lambda shop_id: f"/shop/{shop_id}/products/batch",
+            lambda _: [{"product_id": product_id} for product_id in sample(20)],
+            prepare=empty_shops,
+        ),
+        Scenario(
+            "get shop deletion",
+            "GET",
+            "/shop/<shop_id>/deletion",
+            lambda shop_id: f"/shop/{shop_id}/deletion",
+            prepare=deleted_shops,
+        ),
+        Scenario(
+            "get shop product",
+            "GET",
+            "/shop/<shop_id>/products/<product_id>",
+            lambda _: f"/shop/{shop(_)}/products/{product(_)}",
+        ),
+        Scenario(
+            "add product to shop",
+            "POST",
+            "/shop/<shop_id>/products/<product_id>",
+            lambda pair: f"/shop/{pair[0]}/products/{pair[1]}",
+            lambda _: {"quantity": 1},
+            prepare=unstocked,
+        ),
+        Scenario(
+            "update shop product",
+            "PUT",
+            "/shop/<shop_id>/products/<product_id>",
+            lambda _: f"/shop/{shop(_)}/products/{product(_)}",
+            lambda _: {"quantity": random.randint(1, 10)},
+        ),
+        Scenario(
+            "adjust shop product quantity",
+            "POST",
+            "/shop/<shop_id>/products/<product_id>/adjust",
+            lambda _: f"/shop/{shop(_)}/products/{product(_)}/adjust",
+            lambda _: {"delta": random.choice([-1, 1])},
+        ),
+        Scenario(
+            "remove product from shop",
+            "DELETE",
+            "/shop/<shop_id>/products/<product_id>",
+            lambda pair: f"/shop/{pair[0]}/products/{pair[1]}",
+            prepare=stocked,
+        ),
+    ]
+
+
+def run(driver, scenario, requests, concurrency):
+    arguments = (
+        scenario.prepare(driver, requests)
+        if scenario.prepare is not None
+        else [None] * requests
+    )
+    rpcs_before = driver.rpcs()
+
+    def one(argument):
+        body = scenario.body(argument) if scenario.body is not None else None
+        start = time.perf_counter()
+        status, _, rpcs = driver.request(scenario.method, scenario.path(argument), body)
+        return time.perf_counter() - start, status, rpcs
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, arguments))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, _, _ in outcomes]
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    rpcs = [count for _, _, count in outcomes if count is not None]
+    if not rpcs:
+        before = rpcs_before.get((scenario.method, scenario.route), {})
+        after = driver.rpcs().get((scenario.method, scenario.route), {})
+        requests_seen = after.get("count", 0) - before.get("count", 0)
+        rpcs_per_request = (
+            (after.get("sum", 0) - before.get("sum", 0)) / requests_seen
+            if requests_seen
+            else None
+        )
+    else:
+        rpcs_per_request = statistics.mean(rpcs)
+
+    return {
+        "requests": len(outcomes),
+        "errors": sum(1 for _, status, _ in outcomes if status >= 400),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentiles[49],
+        "p95_ms": percentiles[94],
+        "p99_ms": percentiles[98],
+        "throughput_rps": len(outcomes) / elapsed,
+        "rpcs_per_request": rpcs_per_request,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", type=int, default=10)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--gunicorn", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--only", help="run only scenarios whose name contains this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+    if args.requests < 2:
+        parser.error("--requests must be at least 2 to compute percentiles")
+
+    random.seed(args.seed)
+    driver = (
+        GunicornDriver(args.workers, args.threads)
+        if args.gunicorn
+        else TestClientDriver()
+    )
+    results = {}
+    try:
+        data = seed(driver, args.shops, args.products)
+        for scenario in scenarios(data):
+            if args.only and args.only not in scenario.name:
+                continue
+            results[scenario.name] = run(
+                driver, scenario, args.requests, args.concurrency
+            )
+            result = results[scenario.name]
+            print(
+                f"{scenario.name:<30} p50 {result['p50_ms']:8.2f} ms  "
+                f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+                f"{result['throughput_rps']:8.1f} req/s  "
+                f"rpcs {result['rpcs_per_request']}"
+            )
+    finally:
+        driver.close()
+
+    with open(args.output, "w") as output:
+        json.dump(
+            {
+                "commit": _commit(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "driver": driver.name,
+                "config": {
+                    key: value
+                    for key, value in vars(args).items()
+                    if key not in ("output", "gunicorn")
+                },
+                "environment": {
+                    key: value
+                    for key, value in os.environ.items()
+                    if key.startswith(("FIRESTORE_", "DOCUMENT_CACHE", "QUERY_CACHE"))
+                    or key == "PRICE_INDEX"
+                },
+                "results": results,
+            },
+            output,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import datetime
+import random
+import time
+import flask
+from flask.json.provider import DefaultJSONProvider
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from src import json_provider
+from src.json_provider import FirestoreJSONProvider
+
+# times serialising a listing of shop products per document count with the
+# default flask provider, the firestore provider on the standard library and
+# the firestore provider on orjson, run with:
+# python3 -m benchmarks.json_provider --sizes 100 1000 10000 [--timestamps]
+
+
+def documents(size, timestamps):
+    listing = [
+        {
+            "name": f"product {i}",
+            "description": "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=100)),
+            "price": random.randint(1, 10000) / 100,
+            "quantity": random.randint(0, 100),
+            "product_id": f"product-{i}",
+        }
+        for i in range(size)
+    ]
+    if timestamps:
+        for document in listing:
+            document["updated_at"] = DatetimeWithNanoseconds.now(datetime.timezone.utc)
+    return listing
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+# the default provider writes dates as http dates, so with timestamps it is
+# timed with the conversion a caller of it would have to make first
+def default_response(provider, listing, timestamps):
+    if not timestamps:
+        return provider.response(listing)
+    return provider.response(
+        [
+            {
+                key: value.rfc3339() if isinstance(value, datetime.datetime) else value
+                for key, value in document.items()
+            }
+            for document in listing
+        ]
+    )
+
+
+def benchmark(size, repeat, timestamps):
+    app = flask.Flask(__name__)
+    listing = documents(size, timestamps)
+    default = DefaultJSONProvider(app)
+    firestore = FirestoreJSONProvider(app)
+    orjson = json_provider.orjson
+
+    results = []
+    with app.app_context():
+        results.append(
+            (
+                "default",
+                *timed(lambda: default_response(default, listing, timestamps), repeat),
+            )
+        )
+        json_provider.orjson = None
+        results.append(("stdlib", *timed(lambda: firestore.response(listing), repeat)))
+        json_provider.orjson = orjson
+        if orjson is not None:
+            results.append(
+                ("orjson", *timed(lambda: firestore.response(listing), repeat))
+            )
+
+    baseline = results[0][1]
+    for name, seconds, response in results:
+        print(
+            f"{size:>8} documents  {name:<8} {seconds * 1000:9.3f} ms  "
+            f"{len(response.data):>10} bytes  {baseline / seconds:6.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--timestamps",
+        action="store_true",
+        help="give every document a firestore timestamp",
+    )
+    args = parser.parse_args()
+    for size in args.sizes:
+        benchmark(size, args.repeat, args.timestamps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import random
+import time
+from google.cloud.firestore_v1.base_query import FieldFilter
+from src.price_index import PriceIndex
+
+# compares a price range lookup on the in memory index with the same range
+# query sent to firestore, run with:
+# python3 -m benchmarks.price_index --sizes 10000 100000 1000000 [--firestore]
+
+BENCHMARK_COLLECTION_NAME = "benchmark_products"
+FIRESTORE_BATCH_SIZE = 500
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def seed_firestore(collection, prices):
+    from src.firestore_db import firestore_db
+
+    for doc in collection.stream():
+        doc.reference.delete()
+    for start in range(0, len(prices), FIRESTORE_BATCH_SIZE):
+        batch = firestore_db.batch()
+        for doc_id, price in prices[start : start + FIRESTORE_BATCH_SIZE]:
+            batch.set(collection.document(doc_id), {"price": price})
+        batch.commit()
+
+
+def benchmark(size, repeat, firestore):
+    prices = [(f"product-{i}", random.randint(1, 10000) / 100) for i in range(size)]
+    min_price, max_price = 20.0, 20.5
+
+    start = time.perf_counter()
+    index = PriceIndex(prices)
+    build_time = time.perf_counter() - start
+    index_time, ids = timed(lambda: index.range(min_price, max_price), repeat)
+    upsert_time, _ = timed(lambda: index.upsert("product-0", random.random()), repeat)
+    print(
+        f"{size:>8} products  build {build_time * 1000:9.2f} ms  "
+        f"range {index_time * 1e6:9.2f} us ({len(ids)} hits)  "
+        f"upsert {upsert_time * 1e6:9.2f} us"
+    )
+
+    if firestore:
+        from src.firestore_db import firestore_db
+
+        collection = firestore_db.collection(BENCHMARK_COLLECTION_NAME)
+        seed_firestore(collection, prices)
+        query = collection.where(filter=FieldFilter("price", ">=", min_price)).where(
+            filter=FieldFilter("price", "<=", max_price)
+        )
+        query_time, snapshots = timed(lambda: query.select(["price"]).get(), repeat)
+        print(
+            f"{size:>8} products  firestore range {query_time * 1000:9.2f} ms "
+            f"({len(snapshots)} hits)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument(
+        "--firestore",
+        action="store_true",
+        help="also time the range query against the firestore emulator",
+    )
+    args = parser.parse_args()
+    for size in args.sizes:
+        benchmark(size, args.repeat, args.firestore)
+
+
+if __name__ == "__main__":
+    main()
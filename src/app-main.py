@@ -1,14 +1,41 @@
 import flask
 from .shop import shop_blueprint
 from .products import products_blueprint
+from .shop_products import shop_products_blueprint
 from .healthz import healthz_blueprint
+from .msgpack_format import MsgpackRequest, NegotiatingJSONProvider
+from .metrics import metrics_blueprint
+from . import metrics
+from . import cache_listener
+from . import compression
+from .documents import FIRESTORE_TRANSACTIONAL_UPDATES_ENABLED
 
 app = flask.Flask(__name__)
 
+# compact json that encodes firestore values as they come out of to_dict, or
+# messagepack for clients that ask for it, request bodies may be either
+app.json = NegotiatingJSONProvider(app)
+app.request_class = MsgpackRequest
+
+# apply PUT bodies in a transaction instead of guarding them with the update
+# time read first, set with the FIRESTORE_TRANSACTIONAL_UPDATES environment
+app.config["FIRESTORE_TRANSACTIONAL_UPDATES"] = FIRESTORE_TRANSACTIONAL_UPDATES_ENABLED
+
 # have flask ignore slashes
 app.url_map.strict_slashes = False
 
 # register the blueprints
 app.register_blueprint(shop_blueprint, url_prefix="/shop")
 app.register_blueprint(products_blueprint, url_prefix="/products")
+app.register_blueprint(shop_products_blueprint, url_prefix="/shop-products")
 app.register_blueprint(healthz_blueprint, url_prefix="/healthz")
+app.register_blueprint(metrics_blueprint, url_prefix="/metrics")
+
+# record latency, status and firestore rpcs of every request
+metrics.init_app(app)
+
+# keep the document cache of this worker in line with writes made by others
+cache_listener.init_app(app)
+
+# compress responses for clients that accept gzip or brotli
+compression.init_app(app)
@@ -0,0 +1,77 @@
+import asyncio
+import contextvars
+import os
+import threading
+from .firestore_db import (
+    FIRESTORE_BACKEND,
+    TunedAsyncClient,
+    firestore_db,
+    recorded,
+)
+
+# grpc aio channels are bound to the event loop they were created on, so every
+# process runs one background loop owning a long lived AsyncClient and the
+# synchronous views hand their independent lookups to it, coroutines run in a
+# copy of the context of the caller so rpc listeners see the request they are
+# made for
+
+FIRESTORE_ASYNC_ENABLED = os.environ.get("FIRESTORE_ASYNC", "0").lower() in (
+    "1",
+    "true",
+)
+
+_lock = threading.Lock()
+_loop = None
+_client = None
+_pid = None
+
+
+def _get_loop():
+    global _loop, _client, _pid
+    with _lock:
+        # the loop thread does not survive a fork, start a new one per process
+        if _pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _client = None
+            threading.Thread(
+                target=_loop.run_forever, name="firestore-async", daemon=True
+            ).start()
+            _pid = os.getpid()
+        return _loop
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = TunedAsyncClient()
+    return _client
+
+
+async def _in_context(coroutine, context):
+    return await asyncio.get_running_loop().create_task(
+        recorded(coroutine), context=context
+    )
+
+
+def run(coroutine):
+    return asyncio.run_coroutine_threadsafe(
+        _in_context(coroutine, contextvars.copy_context()), _get_loop()
+    ).result()
+
+
+async def _gather_documents(paths):
+    client = _get_client()
+    return await asyncio.gather(*(client.document(path).get() for path in paths))
+
+
+# fetches every document concurrently, the caller waits for the slowest lookup
+# instead of the sum of them
+def get_documents(references):
+    # the in memory backend has no async client and no round trips to overlap
+    if FIRESTORE_BACKEND == "memory":
+        snapshots = {
+            snapshot.reference.path: snapshot
+            for snapshot in firestore_db.get_all(references)
+        }
+        return [snapshots[reference.path] for reference in references]
+    return run(_gather_documents([reference.path for reference in references]))
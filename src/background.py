@@ -0,0 +1,23 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# long running jobs are run off the request threads on a small per process pool,
+# the pool size bounds how many of them hit firestore at the same time
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "2"))
+
+_lock = threading.Lock()
+_executor = None
+_pid = None
+
+
+def submit(function, *args, **kwargs):
+    global _executor, _pid
+    with _lock:
+        # executor threads do not survive a fork, start a new pool per process
+        if _pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=BACKGROUND_WORKERS, thread_name_prefix="background"
+            )
+            _pid = os.getpid()
+        return _executor.submit(function, *args, **kwargs)
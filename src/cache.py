@@ -0,0 +1,147 @@
+import os
+import threading
+import cachetools
+
+DOCUMENT_CACHE_TTL = float(os.environ.get("DOCUMENT_CACHE_TTL", "30"))
+DOCUMENT_CACHE_MAXSIZE = int(os.environ.get("DOCUMENT_CACHE_MAXSIZE", "4096"))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "10"))
+QUERY_CACHE_MAXSIZE = int(os.environ.get("QUERY_CACHE_MAXSIZE", "256"))
+
+
+class _CountingTTLCache(cachetools.TTLCache):
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.evictions = 0
+        self.expirations = 0
+
+    def expire(self, time=None):
+        size = cachetools.Cache.__len__(self)
+        super().expire(time)
+        self.expirations += size - cachetools.Cache.__len__(self)
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def clear(self):
+        evictions = self.evictions
+        super().clear()
+        self.evictions = evictions
+
+
+class DocumentCache:
+    # process wide read through cache of document snapshots keyed by document
+    # path, entries are dropped after ttl seconds, least recently used entries
+    # are dropped once maxsize is reached and a ttl of 0 disables the cache
+    def __init__(self, maxsize=DOCUMENT_CACHE_MAXSIZE, ttl=DOCUMENT_CACHE_TTL):
+        self.enabled = ttl > 0 and maxsize > 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache = _CountingTTLCache(max(maxsize, 1), ttl)
+        # every invalidation or refresh of a path is numbered, the number of
+        # the last one is kept for the maxsize most recent paths and the
+        # highest number forgotten covers all others
+        self._invalidations = 0
+        self._invalidated = {}
+        self._forgotten = 0
+
+    def get(self, path):
+        with self._lock:
+            self._cache.expire()
+            snapshot = self._cache.get(path)
+            if snapshot is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return snapshot
+
+    # taken before a document is read and handed to put, so a snapshot read
+    # while the path was invalidated or refreshed is not stored over it
+    def version(self):
+        with self._lock:
+            return self._invalidations
+
+    def put(self, path, snapshot, version):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._invalidated.get(path, self._forgotten) <= version:
+                self._cache[path] = snapshot
+
+    def _bump(self, path):
+        self._invalidations += 1
+        self._invalidated.pop(path, None)
+        self._invalidated[path] = self._invalidations
+        if len(self._invalidated) > self._cache.maxsize:
+            oldest = next(iter(self._invalidated))
+            self._forgotten = self._invalidated.pop(oldest)
+
+    # only refreshes entries that are already cached so a listener replaying a
+    # whole collection does not fill the cache with documents nobody asked for
+    def refresh(self, path, snapshot):
+        with self._lock:
+            self._bump(path)
+            if path in self._cache:
+                self._cache[path] = snapshot
+
+    def invalidate(self, path):
+        with self._lock:
+            self._bump(path)
+            self._cache.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._invalidated.clear()
+            self._forgotten = self._invalidations
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self._cache.evictions,
+                "expirations": self._cache.expirations,
+                "size": len(self._cache),
+            }
+
+
+class QueryCache(DocumentCache):
+    # caches query results by collection path and a normalised filter key, a
+    # write to the collection bumps its generation so every cached result for
+    # it is missed from then on and ages out of the cache
+    def __init__(self, maxsize=QUERY_CACHE_MAXSIZE, ttl=QUERY_CACHE_TTL):
+        super().__init__(maxsize, ttl)
+        self._generations = {}
+
+    # returns the cached result or None together with the generation of the
+    # collection, which is handed to put so a result read while the collection
+    # was written to is not stored
+    def get(self, collection_path, key):
+        with self._lock:
+            generation = self._generations.get(collection_path, 0)
+        return super().get((collection_path, generation, key)), generation
+
+    def put(self, collection_path, key, snapshots, generation):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._generations.get(collection_path, 0) == generation:
+                self._cache[(collection_path, generation, key)] = snapshots
+
+    def invalidate(self, collection_path):
+        with self._lock:
+            self._generations[collection_path] = (
+                self._generations.get(collection_path, 0) + 1
+            )
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._generations.clear()
+
+
+document_cache = DocumentCache()
+query_cache = QueryCache()
@@ -0,0 +1,108 @@
+import os
+import threading
+from collections import OrderedDict
+from google.cloud.firestore_v1.watch import ChangeType
+from .cache import document_cache, query_cache
+from .documents import load_price_index
+from .firestore_db import firestore_db
+from .price_index import price_indexes
+from .products import PRODUCTS_COLLECTION_NAME
+from .shop import SHOP_COLLECTION_NAME
+
+# keeps the process wide document cache in line with writes made by other
+# workers, every worker listens to the cached collections and evicts or
+# refreshes its entries as firestore pushes the changes, with the price index
+# enabled the products of a shop are listened to once its index is asked for
+# and the products index is loaded as the listeners start
+
+LISTENER_ENABLED = os.environ.get("DOCUMENT_CACHE_LISTENER", "0").lower() in (
+    "1",
+    "true",
+)
+LISTENED_COLLECTION_NAMES = [PRODUCTS_COLLECTION_NAME, SHOP_COLLECTION_NAME]
+# every listener holds the documents of its collection, so only the products
+# of this many shops are listened to at once, the least recently asked for
+# shop loses its listener and its price index first
+PRICE_INDEX_MAX_LISTENERS = int(os.environ.get("PRICE_INDEX_MAX_LISTENERS", "100"))
+
+_lock = threading.Lock()
+_watches = []
+_collection_watches = OrderedDict()
+_pid = None
+
+
+def _on_snapshot(collection_snapshot, changes, read_time):
+    collection_paths = set()
+    for change in changes:
+        path = change.document.reference.path
+        collection_path = path.rsplit("/", 1)[0]
+        collection_paths.add(collection_path)
+        if change.type == ChangeType.REMOVED:
+            document_cache.invalidate(path)
+            price_indexes.record_delete(collection_path, change.document.id)
+        else:
+            document_cache.refresh(path, change.document)
+            price_indexes.record_write(
+                collection_path,
+                change.document.id,
+                change.document.to_dict(),
+                replace=True,
+            )
+    for collection_path in collection_paths:
+        query_cache.invalidate(collection_path)
+
+
+def start():
+    global _pid
+    with _lock:
+        # listeners run on background threads which do not survive a fork, so
+        # they are started lazily in every worker process
+        if _pid == os.getpid():
+            return
+        _watches.clear()
+        _collection_watches.clear()
+        for collection_name in LISTENED_COLLECTION_NAMES:
+            _watches.append(_watch(collection_name))
+        if price_indexes.enabled:
+            price_indexes.watch = watch_collection
+            load_price_index(firestore_db.collection(PRODUCTS_COLLECTION_NAME))
+        _pid = os.getpid()
+
+
+def _watch(collection_path):
+    watch = firestore_db.collection(collection_path).on_snapshot(_on_snapshot)
+    price_indexes.watched(collection_path)
+    return watch
+
+
+def watch_collection(collection_path):
+    with _lock:
+        if _pid != os.getpid():
+            return
+        if collection_path in _collection_watches:
+            _collection_watches.move_to_end(collection_path)
+            return
+        if price_indexes.is_watched(collection_path):
+            return
+        _collection_watches[collection_path] = _watch(collection_path)
+        while len(_collection_watches) > PRICE_INDEX_MAX_LISTENERS:
+            path, watch = _collection_watches.popitem(last=False)
+            watch.unsubscribe()
+            price_indexes.unwatch(path)
+
+
+def stop():
+    global _pid
+    with _lock:
+        for watch in _watches + list(_collection_watches.values()):
+            watch.unsubscribe()
+        _watches.clear()
+        _collection_watches.clear()
+        price_indexes.unwatch_all()
+        _pid = None
+
+
+def init_app(app):
+    if not LISTENER_ENABLED:
+        return
+    app.before_request(start)
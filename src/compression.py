@@ -0,0 +1,99 @@
+import gzip
+import os
+import zlib
+import flask
+from .conditional import variant_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# compresses json, ndjson and text responses with the best encoding the client
+# accepts, bodies under COMPRESSION_MIN_SIZE bytes are sent as they are since
+# the headers and cpu cost more than they save, streamed bodies are compressed
+# chunk by chunk as they are produced
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "500"))
+# gzip level from 1 to 9 and brotli quality from 0 to 11
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "text/plain",
+    "text/html",
+}
+# in order of preference when the client accepts several equally
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+# the compress, flush and finish steps of an incremental compressor
+def _compressor(encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+
+def _compress(encoding, data):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, COMPRESSION_LEVEL, mtime=0)
+
+
+# every chunk is flushed as it is compressed so a client gets each part of a
+# stream as soon as it is produced, at the cost of a few bytes per chunk
+def _compressed_stream(body, encoding):
+    compress, flush, finish = _compressor(encoding)
+    try:
+        for chunk in body:
+            data = compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            data += flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+def compress_response(response):
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES and response.status_code != 304:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = flask.request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None or "Content-Encoding" in response.headers:
+        return response
+
+    etag, weak = response.get_etag()
+    if response.status_code == 304:
+        # a client revalidating a compressed variant gets its etag back
+        if etag and flask.request.if_none_match.contains(variant_etag(etag, encoding)):
+            response.set_etag(variant_etag(etag, encoding), weak)
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206):
+        return response
+
+    if response.is_streamed:
+        response.response = _compressed_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return response
+        response.set_data(_compress(encoding, data))
+    response.headers["Content-Encoding"] = encoding
+    if etag:
+        response.set_etag(variant_etag(etag, encoding), weak)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,148 @@
+import hashlib
+import flask
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.api_core.exceptions import FailedPrecondition
+from google.protobuf import timestamp_pb2
+from .documents import get_document
+from .msgpack_format import wants_msgpack
+
+# validators for conditional GETs, a document is identified by its update time
+# and a listing by the ids and update times of the documents in it, so a client
+# holding a current copy gets a 304 without the payload being serialised
+
+
+def _version(update_time):
+    timestamp = update_time.timestamp_pb()
+    return f"{timestamp.seconds}.{timestamp.nanos:09d}"
+
+
+def document_etag(snapshot):
+    return _version(snapshot.update_time)
+
+
+def _update_time(etag):
+    seconds, _, nanos = etag.partition(".")
+    try:
+        return DatetimeWithNanoseconds.from_timestamp_pb(
+            timestamp_pb2.Timestamp(seconds=int(seconds), nanos=int(nanos))
+        )
+    except (ValueError, OverflowError):
+        raise FailedPrecondition(f"{etag} is not an etag of this service")
+
+
+# the messagepack and compressed representations of a document version carry
+# its etag with the name of the variant appended so caches tell them apart
+def variant_etag(etag, variant):
+    return f"{etag}-{variant}"
+
+
+# content codings only change how a representation is sent, a client holding
+# a compressed variant holds the representation it was compressed from
+CONTENT_CODINGS = ("br", "gzip")
+
+
+def _without_content_coding(etag):
+    representation, _, coding = etag.rpartition("-")
+    return representation if representation and coding in CONTENT_CODINGS else etag
+
+
+# the etag of the representation the current request is answered with
+def representation_etag(etag):
+    return variant_etag(etag, "msgpack") if wants_msgpack() else etag
+
+
+# the document versions named by a conditional header, every variant names the
+# version it was made from, weak etags are left out
+def _request_etags(etags):
+    return {etag.partition("-")[0] for etag in etags.as_set()}
+
+
+# If-None-Match only matches the representation the client would get, a json
+# copy cannot stand in for messagepack
+def _matches_representation(etags, etag):
+    return etags.star_tag or representation_etag(etag) in {
+        _without_content_coding(request_etag) for request_etag in etags.as_set()
+    }
+
+
+# the update time an If-Match header pins a write to, None without the header
+# or for "*", a single etag is turned into a write precondition without reading
+# the document, raises FailedPrecondition when no listed etag can match
+def if_match_update_time(reference):
+    etags = flask.request.if_match
+    if not etags or etags.star_tag:
+        return None
+    candidates = _request_etags(etags)
+    if len(candidates) > 1:
+        snapshot = get_document(reference)
+        candidates = (
+            {document_etag(snapshot)}
+            if snapshot.exists and document_etag(snapshot) in candidates
+            else set()
+        )
+    if len(candidates) != 1:
+        raise FailedPrecondition("No etag in If-Match matches the document")
+    return _update_time(candidates.pop())
+
+
+def listing_etag(snapshots):
+    digest = hashlib.sha1()
+    for path, version in sorted(
+        (snapshot.reference.path, _version(snapshot.update_time))
+        for snapshot in snapshots
+    ):
+        digest.update(f"{path}@{version}\n".encode())
+    return digest.hexdigest()
+
+
+def last_modified(snapshots):
+    return max((snapshot.update_time for snapshot in snapshots), default=None)
+
+
+def with_validators(response, etag, modified=None):
+    response.set_etag(representation_etag(etag))
+    if modified is not None:
+        response.last_modified = modified
+    return response
+
+
+# a 304 when the client copy is current, If-Modified-Since is only honoured
+# when check_modified_since is set as a listing that lost a document keeps the
+# update time of the newest one
+def not_modified(etag, modified=None, check_modified_since=True):
+    if flask.request.if_none_match:
+        fresh = _matches_representation(flask.request.if_none_match, etag)
+    elif check_modified_since and modified is not None:
+        since = flask.request.if_modified_since
+        fresh = since is not None and modified.replace(microsecond=0) <= since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    response = flask.Response(status=304)
+    # the representation depends on Accept, as the 200 says with its own Vary
+    response.vary.add("Accept")
+    return with_validators(response, etag, modified)
+
+
+def document_response(snapshot):
+    etag = document_etag(snapshot)
+    response = not_modified(etag, snapshot.update_time)
+    if response is None:
+        response = with_validators(
+            flask.jsonify(snapshot.to_dict()), etag, snapshot.update_time
+        )
+    return response
+
+
+def listing_response(snapshots):
+    etag = listing_etag(snapshots)
+    modified = last_modified(snapshots)
+    response = not_modified(etag, modified, check_modified_since=False)
+    if response is None:
+        response = with_validators(
+            flask.jsonify([snapshot.to_dict() for snapshot in snapshots]),
+            etag,
+            modified,
+        )
+    return response
@@ -0,0 +1,414 @@
+import os
+import flask
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud import firestore
+from google.cloud.firestore_v1 import _helpers
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+from .firestore_db import firestore_db
+from . import async_firestore_db
+from .cache import document_cache, query_cache
+from .price_index import in_price_range, price_indexes
+
+FIRESTORE_BATCH_LIMIT = 500
+# the bulk writer ramps its rate of deletes up to this
+BULK_DELETE_MAX_OPS_PER_SECOND = int(
+    os.environ.get("BULK_DELETE_MAX_OPS_PER_SECOND", "500")
+)
+# the default of the FIRESTORE_TRANSACTIONAL_UPDATES app setting
+FIRESTORE_TRANSACTIONAL_UPDATES_ENABLED = os.environ.get(
+    "FIRESTORE_TRANSACTIONAL_UPDATES", "0"
+).lower() in ("1", "true")
+
+# request scoped access to firestore, every document is fetched at most once per
+# request, the round trips of a request are counted on flask.g by the rpc
+# listener of the metrics so the number of rpcs an endpoint makes can be
+# asserted in tests
+
+
+def rpc_count():
+    calls = flask.g.get("firestore_calls")
+    return 0 if calls is None else calls.count
+
+
+def _snapshots():
+    if "firestore_snapshots" not in flask.g:
+        flask.g.firestore_snapshots = {}
+    return flask.g.firestore_snapshots
+
+
+def collection_path(collection):
+    return "/".join(collection._path)
+
+
+def forget_document(reference):
+    _snapshots().pop(reference.path, None)
+    document_cache.invalidate(reference.path)
+    query_cache.invalidate(collection_path(reference.parent))
+
+
+def get_document(reference):
+    snapshots = _snapshots()
+    if reference.path not in snapshots:
+        snapshots[reference.path] = reference.get()
+    return snapshots[reference.path]
+
+
+# read only lookups can be served from the process wide cache, writes must use
+# get_document so their preconditions are checked against a fresh snapshot
+def get_cached_document(reference):
+    snapshot = document_cache.get(reference.path)
+    if snapshot is None:
+        version = document_cache.version()
+        snapshot = get_document(reference)
+        if snapshot.exists:
+            document_cache.put(reference.path, snapshot, version)
+    return snapshot
+
+
+# resolves all references with one get_all call, in the order they were given
+def get_documents(references):
+    snapshots = _snapshots()
+    missing = {
+        reference.path: reference
+        for reference in references
+        if reference.path not in snapshots
+    }
+    if missing:
+        for snapshot in firestore_db.get_all(list(missing.values())):
+            snapshots[snapshot.reference.path] = snapshot
+    return [snapshots[reference.path] for reference in references]
+
+
+# fetches a handful of independent documents a handler is about to look at in
+# one round trip, either one get_all call or concurrent lookups on the async
+# client when FIRESTORE_ASYNC is set, later get_document calls reuse them
+def prefetch_documents(references):
+    if not async_firestore_db.FIRESTORE_ASYNC_ENABLED:
+        get_documents(references)
+        return
+    snapshots = _snapshots()
+    missing = {
+        reference.path: reference
+        for reference in references
+        if reference.path not in snapshots
+    }
+    for path, snapshot in zip(
+        missing, async_firestore_db.get_documents(list(missing.values()))
+    ):
+        snapshots[path] = snapshot
+
+
+def get_cached_documents(references):
+    cached = {
+        reference.path: document_cache.get(reference.path) for reference in references
+    }
+    version = document_cache.version()
+    get_documents(
+        [reference for reference in references if cached[reference.path] is None]
+    )
+    snapshots = []
+    for reference in references:
+        snapshot = cached[reference.path]
+        if snapshot is None:
+            snapshot = get_document(reference)
+            if snapshot.exists:
+                document_cache.put(reference.path, snapshot, version)
+        snapshots.append(snapshot)
+    return snapshots
+
+
+# whether price ranges of the collection can be answered from its index, only
+# true while a snapshot listener brings the writes of other workers into it and
+# once the index is loaded, which happens in the background so until then the
+# range is queried
+def serves_price_range(collection):
+    if not price_indexes.covers(collection_path(collection)):
+        return False
+    load_price_index(collection)
+    return price_indexes.get(collection_path(collection)) is not None
+
+
+def load_price_index(collection):
+    price_indexes.load_when_stale(
+        collection_path(collection), collection.select(["price"]).stream
+    )
+
+
+# answers a price range from the in memory index of the collection and fetches
+# the matching documents in one batch, callers check serves_price_range first
+def get_price_range(collection, min_price=None, max_price=None):
+    index = price_indexes.get(collection_path(collection))
+    if index is None:
+        # dropped since serves_price_range, e.g. as its listener was stopped
+        query = collection
+        if min_price is not None:
+            query = query.where(filter=FieldFilter("price", ">=", min_price))
+        if max_price is not None:
+            query = query.where(filter=FieldFilter("price", "<=", max_price))
+        return get_query(query.order_by("price"))
+    snapshots = get_documents(
+        [collection.document(doc_id) for doc_id in index.range(min_price, max_price)]
+    )
+    # the listener may not have delivered a change yet, so check against the
+    # documents, a missing id is only picked up once the change arrives
+    return [
+        snapshot
+        for snapshot in snapshots
+        if snapshot.exists
+        and in_price_range(snapshot.to_dict().get("price"), min_price, max_price)
+    ]
+
+
+def get_query(query):
+    return query.get()
+
+
+# results are only cached for price ranges, callers pass the range as the key
+def get_cached_query(collection, key, query):
+    path = collection_path(collection)
+    snapshots, generation = query_cache.get(path, key)
+    if snapshots is None:
+        snapshots = get_query(query)
+        query_cache.put(path, key, snapshots, generation)
+    return snapshots
+
+
+# the documents a cached query would return with their update times, taken
+# from the cached result when there is one and otherwise from a query that
+# reads no fields, enough to answer a conditional request
+def get_query_versions(collection, key, query):
+    snapshots, _ = query_cache.get(collection_path(collection), key)
+    if snapshots is None:
+        snapshots = get_query(query.select([]))
+    return snapshots
+
+
+# count, sum and average of a numeric field over the documents of a query in
+# one aggregation rpc, firestore only sums and averages numeric values and the
+# client reads a count of 0 and an average over no documents back as 0.0
+def get_aggregation(query, field):
+    results = (
+        query.count(alias="count")
+        .sum(field, alias="sum")
+        .avg(field, alias="average")
+        .get()
+    )
+    values = {result.alias: result.value for result in results[0]}
+    count = int(values["count"])
+    return {
+        "count": count,
+        "sum": values["sum"],
+        "average": values["average"] if count else None,
+    }
+
+
+# the aggregation is cached next to the query results of the collection so a
+# write to it drops the rollup as well
+def get_cached_aggregation(collection, key, query, field):
+    path = collection_path(collection)
+    key = ("aggregation", field, key)
+    aggregation, generation = query_cache.get(path, key)
+    if aggregation is None:
+        aggregation = get_aggregation(query, field)
+        query_cache.put(path, key, aggregation, generation)
+    return aggregation
+
+
+def stream_query(query):
+    return query.stream()
+
+
+def add_document(collection, data):
+    _, reference = collection.add(data)
+    forget_document(reference)
+    price_indexes.record_write(
+        collection_path(collection), reference.id, data, replace=True
+    )
+    return reference
+
+
+def set_document(reference, data):
+    reference.set(data)
+    forget_document(reference)
+    price_indexes.record_write(
+        collection_path(reference.parent), reference.id, data, replace=True
+    )
+
+
+# writes the documents with batched writes, chunked at the firestore limit of
+# operations per batch
+def set_documents(writes):
+    for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+        batch = firestore_db.batch()
+        for reference, data in writes[start : start + FIRESTORE_BATCH_LIMIT]:
+            batch.set(reference, data)
+        batch.commit()
+    for reference, data in writes:
+        forget_document(reference)
+        price_indexes.record_write(
+            collection_path(reference.parent), reference.id, data, replace=True
+        )
+
+
+# updates the documents with batched writes, a batch refused because one of its
+# documents is gone is retried document by document so the others are still
+# updated, returns the references that no longer exist
+def update_documents(references, data):
+    missing = []
+    for start in range(0, len(references), FIRESTORE_BATCH_LIMIT):
+        chunk = references[start : start + FIRESTORE_BATCH_LIMIT]
+        batch = firestore_db.batch()
+        for reference in chunk:
+            batch.update(reference, data)
+        try:
+            batch.commit()
+        except NotFound:
+            for reference in chunk:
+                try:
+                    reference.update(data)
+                except NotFound:
+                    missing.append(reference)
+        for reference in chunk:
+            forget_document(reference)
+            if reference in missing:
+                price_indexes.record_delete(
+                    collection_path(reference.parent), reference.id
+                )
+            else:
+                price_indexes.record_write(
+                    collection_path(reference.parent), reference.id, data
+                )
+    return missing
+
+
+# applies the whole body as one write, either guarded by the update time of the
+# snapshot read in this request or inside a transaction when the app is
+# configured with FIRESTORE_TRANSACTIONAL_UPDATES, returns False when the
+# document does not exist and raises FailedPrecondition on a concurrent write,
+# a last_update_time known by the client is checked by firestore on the write
+# itself so the document is not read first
+def update_document(reference, data, last_update_time=None):
+    if last_update_time is not None:
+        updated = _update_at(reference, data, last_update_time)
+    elif flask.current_app.config.get(
+        "FIRESTORE_TRANSACTIONAL_UPDATES", FIRESTORE_TRANSACTIONAL_UPDATES_ENABLED
+    ):
+        updated = _update_in_transaction(firestore_db.transaction(), reference, data)
+    else:
+        updated = _update_with_precondition(reference, data)
+    forget_document(reference)
+    if updated:
+        price_indexes.record_write(
+            collection_path(reference.parent), reference.id, data
+        )
+    return updated
+
+
+def _update_with_precondition(reference, data):
+    snapshot = get_document(reference)
+    if not snapshot.exists:
+        return False
+    if data:
+        reference.update(
+            data,
+            option=firestore_db.write_option(last_update_time=snapshot.update_time),
+        )
+    return True
+
+
+def _update_at(reference, data, last_update_time):
+    if not data:
+        snapshot = get_document(reference)
+        if not snapshot.exists:
+            return False
+        if snapshot.update_time.timestamp_pb() != last_update_time.timestamp_pb():
+            raise FailedPrecondition(f"{reference.path} was updated")
+        return True
+    try:
+        reference.update(
+            data, option=firestore_db.write_option(last_update_time=last_update_time)
+        )
+    except NotFound:
+        return False
+    return True
+
+
+@firestore.transactional
+def _update_in_transaction(transaction, reference, data):
+    snapshot = reference.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    if data:
+        transaction.update(reference, data)
+    return True
+
+
+# adds delta to a numeric field with a server side increment so concurrent
+# adjustments never overwrite each other, with a floor the current value is
+# checked in a transaction first and FailedPrecondition is raised instead of
+# going below it, returns the new value or None when the document is missing
+def increment_document(reference, field, delta, floor=None):
+    if floor is None:
+        try:
+            result = reference.update({field: firestore.Increment(delta)})
+        except NotFound:
+            return None
+        value = _helpers.decode_value(result.transform_results[0], firestore_db)
+    else:
+        value = _increment_in_transaction(
+            firestore_db.transaction(), reference, field, delta, floor
+        )
+    forget_document(reference)
+    return value
+
+
+@firestore.transactional
+def _increment_in_transaction(transaction, reference, field, delta, floor):
+    snapshot = reference.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    current = snapshot.to_dict().get(field)
+    if not isinstance(current, (int, float)) or isinstance(current, bool):
+        current = 0
+    if current + delta < floor:
+        raise FailedPrecondition(
+            f"{field} of {reference.path} would drop below {floor}"
+        )
+    transaction.update(reference, {field: firestore.Increment(delta)})
+    return current + delta
+
+
+# deletes the document and every subcollection below it through a rate limited
+# bulk writer, safe to call from background jobs, returns the number deleted
+def delete_document_tree(reference):
+    subcollections = list(reference.collections())
+    deleted = firestore_db.recursive_delete(
+        reference,
+        bulk_writer=firestore_db.bulk_writer(
+            options=BulkWriterOptions(
+                initial_ops_per_second=min(500, BULK_DELETE_MAX_OPS_PER_SECOND),
+                max_ops_per_second=BULK_DELETE_MAX_OPS_PER_SECOND,
+            )
+        ),
+    )
+    if flask.has_app_context():
+        forget_document(reference)
+    else:
+        document_cache.invalidate(reference.path)
+        query_cache.invalidate(collection_path(reference.parent))
+    for collection in subcollections:
+        query_cache.invalidate(collection_path(collection))
+        price_indexes.drop(collection_path(collection))
+    return deleted
+
+
+# with a last_update_time firestore refuses the delete with FailedPrecondition
+# when the document was changed or removed since
+def delete_document(reference, last_update_time=None):
+    option = None
+    if last_update_time is not None:
+        option = firestore_db.write_option(last_update_time=last_update_time)
+    reference.delete(option=option)
+    forget_document(reference)
+    price_indexes.record_delete(collection_path(reference.parent), reference.id)
@@ -1,9 +1,220 @@
 from google.cloud import firestore
+import asyncio
+import contextvars
+import grpc
+import itertools
 import os
+import threading
+import time
 
-# TODO: Set vie env variables
-os.environ["FIRESTORE_EMULATOR_HOST"] = "127.0.0.1:8082"
-os.environ["GCLOUD_PROJECT"] = "test-project"
+# the client talks to the emulator when FIRESTORE_EMULATOR_HOST is set and to
+# firestore otherwise, the emulator accepts any project id
+if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+    os.environ.setdefault("GCLOUD_PROJECT", "test-project")
 
+# "memory" serves every rpc from an in process store instead of firestore, for
+# tests and benchmarks that should not need the emulator
+FIRESTORE_BACKEND = os.environ.get("FIRESTORE_BACKEND", "firestore").lower()
+FIRESTORE_POOL_SIZE = int(os.environ.get("FIRESTORE_POOL_SIZE", "1"))
+FIRESTORE_KEEPALIVE_TIME_MS = int(
+    os.environ.get("FIRESTORE_KEEPALIVE_TIME_MS", "30000")
+)
+FIRESTORE_KEEPALIVE_TIMEOUT_MS = int(
+    os.environ.get("FIRESTORE_KEEPALIVE_TIMEOUT_MS", "10000")
+)
+FIRESTORE_MAX_MESSAGE_BYTES = int(
+    os.environ.get("FIRESTORE_MAX_MESSAGE_BYTES", str(32 * 1024 * 1024))
+)
 
-firestore_db = firestore.Client()
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", FIRESTORE_KEEPALIVE_TIME_MS),
+    ("grpc.keepalive_timeout_ms", FIRESTORE_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.max_send_message_length", FIRESTORE_MAX_MESSAGE_BYTES),
+    ("grpc.max_receive_message_length", FIRESTORE_MAX_MESSAGE_BYTES),
+    # without a local subchannel pool channels to the same target share one
+    # connection and pooling clients would not spread the load
+    ("grpc.use_local_subchannel_pool", 1),
+]
+
+
+# listeners are called with the grpc method name when an rpc starts and may
+# return a callable that gets the duration in seconds once the rpc is done,
+# this is how request metrics see every round trip the clients make
+_rpc_listeners = []
+
+
+def add_rpc_listener(listener):
+    _rpc_listeners.append(listener)
+
+
+# notifies the listeners that an rpc starts and returns the callback that hands
+# them its duration once the call is done
+def _start_rpc(method):
+    # listeners run on the calling thread, the done callbacks may not
+    if isinstance(method, bytes):
+        method = method.decode()
+    callbacks = [listener(method) for listener in _rpc_listeners]
+    start = time.perf_counter()
+
+    def done(_):
+        seconds = time.perf_counter() - start
+        for callback in callbacks:
+            if callback is not None:
+                callback(seconds)
+
+    return done
+
+
+class _RpcTimingInterceptor(
+    grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor
+):
+    def _intercept(self, continuation, client_call_details, request):
+        done = _start_rpc(client_call_details.method)
+        call = continuation(client_call_details, request)
+        call.add_done_callback(done)
+        return call
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        return self._intercept(continuation, client_call_details, request)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        return self._intercept(continuation, client_call_details, request)
+
+
+# the completions of the async rpcs started by a coroutine run with recorded,
+# grpc may only report a stream as done after its last message was read
+_async_rpcs = contextvars.ContextVar("firestore_async_rpcs", default=None)
+
+
+# awaits the coroutine and then every rpc it started, so they are all recorded
+# by the listeners when it returns
+async def recorded(coroutine):
+    pending = []
+    _async_rpcs.set(pending)
+    result = await coroutine
+    await asyncio.gather(*pending)
+    return result
+
+
+# grpc aio files an interceptor under one kind of call only, so there is one
+# interceptor per kind
+async def _intercept_async(continuation, client_call_details, request):
+    done = _start_rpc(client_call_details.method)
+    call = await continuation(client_call_details, request)
+    finished = asyncio.get_running_loop().create_future()
+
+    def on_done(call):
+        done(call)
+        if not finished.done():
+            finished.set_result(None)
+
+    call.add_done_callback(on_done)
+    pending = _async_rpcs.get()
+    if pending is not None:
+        pending.append(finished)
+    return call
+
+
+class _AsyncUnaryUnaryTimingInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        return await _intercept_async(continuation, client_call_details, request)
+
+
+class _AsyncUnaryStreamTimingInterceptor(grpc.aio.UnaryStreamClientInterceptor):
+    async def intercept_unary_stream(self, continuation, client_call_details, request):
+        return await _intercept_async(continuation, client_call_details, request)
+
+
+class _TunedClient(firestore.Client):
+    # same as the library helper but with our channel options instead of its
+    # hard coded keepalive and with every rpc timed
+    def _firestore_api_helper(self, transport, client_class, client_module):
+        if self._firestore_api_internal is None:
+            if self._emulator_host is not None:
+                channel = grpc.insecure_channel(
+                    self._emulator_host,
+                    options=CHANNEL_OPTIONS + [("Authorization", "Bearer owner")],
+                )
+            else:
+                channel = transport.create_channel(
+                    self._target,
+                    credentials=self._credentials,
+                    options=CHANNEL_OPTIONS,
+                )
+            channel = grpc.intercept_channel(channel, _RpcTimingInterceptor())
+            self._transport = transport(host=self._target, channel=channel)
+            self._firestore_api_internal = client_class(
+                transport=self._transport, client_options=self._client_options
+            )
+            client_module._client_info = self._client_info
+        return self._firestore_api_internal
+
+
+class TunedAsyncClient(firestore.AsyncClient):
+    # the async counterpart of _TunedClient, grpc aio channels take their
+    # interceptors when they are created
+    def _firestore_api_helper(self, transport, client_class, client_module):
+        if self._firestore_api_internal is None:
+            interceptors = [
+                _AsyncUnaryUnaryTimingInterceptor(),
+                _AsyncUnaryStreamTimingInterceptor(),
+            ]
+            if self._emulator_host is not None:
+                channel = grpc.aio.insecure_channel(
+                    self._emulator_host,
+                    options=CHANNEL_OPTIONS + [("Authorization", "Bearer owner")],
+                    interceptors=interceptors,
+                )
+            else:
+                channel = transport.create_channel(
+                    self._target,
+                    credentials=self._credentials,
+                    options=CHANNEL_OPTIONS,
+                    interceptors=interceptors,
+                )
+            self._transport = transport(host=self._target, channel=channel)
+            self._firestore_api_internal = client_class(
+                transport=self._transport, client_options=self._client_options
+            )
+            client_module._client_info = self._client_info
+        return self._firestore_api_internal
+
+
+class FirestoreClientPool:
+    # hands every thread one of size clients, each with its own grpc channel,
+    # clients are created lazily in the process that uses them so gunicorn
+    # workers never inherit a channel opened before the fork
+    def __init__(self, size=FIRESTORE_POOL_SIZE, factory=_TunedClient):
+        self.size = max(size, 1)
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+        self._clients = []
+        self._next = None
+
+    def _assign(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = [self._factory() for _ in range(self.size)]
+                self._next = itertools.cycle(self._clients)
+                self._pid = os.getpid()
+            return self._pid, next(self._next)
+
+    def client(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.pid, self._local.client = self._assign()
+        return self._local.client
+
+    def __getattr__(self, name):
+        return getattr(self.client(), name)
+
+
+if FIRESTORE_BACKEND == "memory":
+    from .memory_db import MemoryClient, MemoryFirestore
+
+    memory_store = MemoryFirestore(_rpc_listeners)
+    firestore_db = FirestoreClientPool(factory=lambda: MemoryClient(memory_store))
+else:
+    firestore_db = FirestoreClientPool()
@@ -0,0 +1,62 @@
+import json
+
+# the indexes the collection group queries over shop products need, deploy the
+# generated firestore.indexes.json with `firebase deploy --only firestore:indexes`
+# after regenerating it with `python3 -m src.firestore_indexes`
+
+SHOP_PRODUCTS_COLLECTION_GROUP = "products"
+
+# (collection group, scope, fields) where fields are (path, order) pairs
+COMPOSITE_INDEXES = [
+    # the shops stocking a product within a price range, ordered by price
+    (
+        SHOP_PRODUCTS_COLLECTION_GROUP,
+        "COLLECTION_GROUP",
+        [("product_id", "ASCENDING"), ("price", "ASCENDING")],
+    ),
+    # every shop product within a price range, ordered by price
+    (
+        SHOP_PRODUCTS_COLLECTION_GROUP,
+        "COLLECTION_GROUP",
+        [("price", "ASCENDING"), ("product_id", "ASCENDING")],
+    ),
+]
+
+# single field indexes that need an extra scope, product id equalities and
+# orders run against the collection group as well as a single shop
+FIELD_OVERRIDES = [
+    (
+        SHOP_PRODUCTS_COLLECTION_GROUP,
+        "product_id",
+        [("ASCENDING", "COLLECTION"), ("ASCENDING", "COLLECTION_GROUP")],
+    ),
+]
+
+
+def manifest():
+    return {
+        "indexes": [
+            {
+                "collectionGroup": collection_group,
+                "queryScope": scope,
+                "fields": [
+                    {"fieldPath": path, "order": order} for path, order in fields
+                ],
+            }
+            for collection_group, scope, fields in COMPOSITE_INDEXES
+        ],
+        "fieldOverrides": [
+            {
+                "collectionGroup": collection_group,
+                "fieldPath": field_path,
+                "indexes": [
+                    {"order": order, "queryScope": scope} for order, scope in indexes
+                ],
+            }
+            for collection_group, field_path, indexes in FIELD_OVERRIDES
+        ],
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(manifest(), indent=2))
@@ -0,0 +1,81 @@
+import datetime
+from flask.json.provider import DefaultJSONProvider, _default
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import GeoPoint
+from google.cloud.firestore_v1.base_document import BaseDocumentReference
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# compact json for every response, encoded with orjson when it is installed and
+# with the standard library otherwise, firestore values are encoded as they come
+# out of to_dict: timestamps as rfc 3339 strings keeping their nanoseconds,
+# document references as their path and geo points as latitude and longitude
+
+ORJSON_OPTIONS = (
+    (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    if orjson is not None
+    else 0
+)
+
+
+# the same text as rfc3339 in about half the time, only timestamps with digits
+# below a microsecond are left to it
+def _rfc3339(value):
+    if value.nanosecond != value.microsecond * 1000:
+        return value.rfc3339()
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%06dZ" % (
+        value.year,
+        value.month,
+        value.day,
+        value.hour,
+        value.minute,
+        value.second,
+        value.microsecond,
+    )
+
+
+def firestore_default(value):
+    if isinstance(value, DatetimeWithNanoseconds):
+        return _rfc3339(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, BaseDocumentReference):
+        return value.path
+    if isinstance(value, GeoPoint):
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    return _default(value)
+
+
+class FirestoreJSONProvider(DefaultJSONProvider):
+    default = staticmethod(firestore_default)
+    ensure_ascii = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj, **kwargs).decode()
+
+    def _dumps(self, obj, **kwargs):
+        # indent is only asked for by callers that want readable output
+        if orjson is not None and "indent" not in kwargs:
+            return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS)
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        kwargs.setdefault("separators", (",", ":"))
+        return super().dumps(obj, **kwargs).encode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    # the body is handed to the response as bytes so it is not decoded and
+    # encoded again on the way out
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self._dumps(obj) + b"\n", mimetype=self.mimetype
+        )
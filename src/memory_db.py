@@ -0,0 +1,728 @@
+import functools
+import itertools
+import os
+import threading
+import time
+import uuid
+from google.api_core import exceptions
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+from google.cloud.firestore_v1 import _helpers, types
+from google.cloud.firestore_v1.base_client import _path_helper
+from google.cloud.firestore_v1.collection import CollectionReference
+from google.cloud.firestore_v1.document import DocumentSnapshot
+from google.cloud.firestore_v1.field_path import parse_field_path
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+from google.protobuf import timestamp_pb2
+
+# an in memory stand in for the firestore service, it answers the rpcs the
+# library client makes so references, queries, batches and transactions all run
+# through the real client code and only the network round trip is replaced
+
+_RPC_PREFIX = "/google.firestore.v1.Firestore/"
+
+_Value = types.Value.pb()
+_MapValue = types.MapValue.pb()
+_Document = types.Document.pb()
+_Operator = types.StructuredQuery.FieldFilter.Operator
+_UnaryOperator = types.StructuredQuery.UnaryFilter.Operator
+_ASCENDING = types.StructuredQuery.Direction.ASCENDING
+_RANGE_OPERATORS = {
+    _Operator.LESS_THAN: lambda order: order < 0,
+    _Operator.LESS_THAN_OR_EQUAL: lambda order: order <= 0,
+    _Operator.GREATER_THAN: lambda order: order > 0,
+    _Operator.GREATER_THAN_OR_EQUAL: lambda order: order >= 0,
+}
+_INEQUALITY_OPERATORS = set(_RANGE_OPERATORS) | {_Operator.NOT_EQUAL, _Operator.NOT_IN}
+
+_NULL_KEY = (0,)
+_NAN_KEY = (2, 0)
+
+
+def _split_name(name):
+    # projects/<project>/databases/<database>/documents[/<path>]
+    parts = name.split("/", 5)
+    return "/".join(parts[:5]), parts[5] if len(parts) > 5 else ""
+
+
+def _join(*parts):
+    return "/".join(part for part in parts if part)
+
+
+# orders values the way firestore does, first by type and then by value
+def _key(value):
+    kind = value.WhichOneof("value_type")
+    if kind is None or kind == "null_value":
+        return _NULL_KEY
+    if kind == "boolean_value":
+        return (1, value.boolean_value)
+    if kind in ("integer_value", "double_value"):
+        number = getattr(value, kind)
+        return _NAN_KEY if number != number else (2, 1, number)
+    if kind == "timestamp_value":
+        return (3, value.timestamp_value.seconds, value.timestamp_value.nanos)
+    if kind == "string_value":
+        return (4, value.string_value)
+    if kind == "bytes_value":
+        return (5, value.bytes_value)
+    if kind == "reference_value":
+        return (6, tuple(_split_name(value.reference_value)[1].split("/")))
+    if kind == "geo_point_value":
+        return (7, value.geo_point_value.latitude, value.geo_point_value.longitude)
+    if kind == "array_value":
+        return (8, tuple(_key(element) for element in value.array_value.values))
+    return (
+        9,
+        tuple(
+            sorted(
+                (name, _key(field)) for name, field in value.map_value.fields.items()
+            )
+        ),
+    )
+
+
+def _compare(left, right):
+    return (left > right) - (left < right)
+
+
+# firestore implicitly orders results by every field with an inequality filter
+def _inequality_fields(where):
+    kind = where.WhichOneof("filter_type")
+    if kind == "composite_filter":
+        return set().union(
+            *(_inequality_fields(child) for child in where.composite_filter.filters)
+        )
+    if kind == "unary_filter":
+        if where.unary_filter.op in (
+            _UnaryOperator.IS_NOT_NAN,
+            _UnaryOperator.IS_NOT_NULL,
+        ):
+            return {where.unary_filter.field.field_path}
+        return set()
+    if where.field_filter.op in _INEQUALITY_OPERATORS:
+        return {where.field_filter.field.field_path}
+    return set()
+
+
+def _get_field(fields, parts):
+    value = None
+    for index, part in enumerate(parts):
+        if part not in fields:
+            return None
+        value = fields[part]
+        if index < len(parts) - 1:
+            if value.WhichOneof("value_type") != "map_value":
+                return None
+            fields = value.map_value.fields
+    return value
+
+
+def _set_field(fields, parts, value):
+    for part in parts[:-1]:
+        parent = fields[part]
+        if parent.WhichOneof("value_type") != "map_value":
+            parent.map_value.SetInParent()
+        fields = parent.map_value.fields
+    fields[parts[-1]].CopyFrom(value)
+
+
+def _delete_field(fields, parts):
+    for part in parts[:-1]:
+        if part not in fields or fields[part].WhichOneof("value_type") != "map_value":
+            return
+        fields = fields[part].map_value.fields
+    if parts[-1] in fields:
+        del fields[parts[-1]]
+
+
+def _project(fields, field_paths):
+    projected = _MapValue()
+    for field_path in field_paths:
+        if field_path == "__name__":
+            continue
+        parts = parse_field_path(field_path)
+        value = _get_field(fields, parts)
+        if value is not None:
+            _set_field(projected.fields, parts, value)
+    return projected.fields
+
+
+def _number(value):
+    kind = value.WhichOneof("value_type")
+    if kind in ("integer_value", "double_value"):
+        return getattr(value, kind)
+    return None
+
+
+def _number_value(number, integer):
+    return _Value(integer_value=number) if integer else _Value(double_value=number)
+
+
+class _Stored:
+    __slots__ = ("fields", "create_time", "update_time")
+
+    def __init__(self, fields, create_time, update_time):
+        self.fields = fields
+        self.create_time = create_time
+        self.update_time = update_time
+
+
+class _Watch:
+    def __init__(self, store, collection, callback):
+        self._store = store
+        self.collection = collection
+        self.path = "/".join(collection._path)
+        self.callback = callback
+
+    def snapshot(self, doc_id, stored, read_time):
+        data = _helpers.decode_dict(stored.fields.fields, self.collection._client)
+        return DocumentSnapshot(
+            self.collection.document(doc_id),
+            data,
+            exists=True,
+            read_time=read_time,
+            create_time=DatetimeWithNanoseconds.from_timestamp_pb(stored.create_time),
+            update_time=DatetimeWithNanoseconds.from_timestamp_pb(stored.update_time),
+        )
+
+    def unsubscribe(self):
+        self._store.unwatch(self)
+
+
+class MemoryFirestore:
+    # the documents of every collection keyed by collection path and document
+    # id, one lock serialises writes and a transaction holds it from begin to
+    # commit or rollback, rpc listeners see every call as if it went over grpc
+    def __init__(self, rpc_listeners=()):
+        self._rpc_listeners = rpc_listeners
+        self._lock = threading.RLock()
+        self._collections = {}
+        self._watches = []
+        self._transactions = set()
+        self._last_time = 0
+
+    def _rpc(self, method):
+        callbacks = [listener(_RPC_PREFIX + method) for listener in self._rpc_listeners]
+        for callback in callbacks:
+            if callback is not None:
+                callback(0.0)
+
+    # strictly increasing times at microsecond precision, as firestore has
+    def _now(self):
+        self._last_time = max(time.time_ns() // 1000 * 1000, self._last_time + 1000)
+        return timestamp_pb2.Timestamp(
+            seconds=self._last_time // 10**9, nanos=self._last_time % 10**9
+        )
+
+    def _stored(self, path):
+        collection_path, _, doc_id = path.rpartition("/")
+        return self._collections.get(collection_path, {}).get(doc_id)
+
+    def _document(self, prefix, path, stored, field_paths=None):
+        fields = stored.fields.fields
+        if field_paths is not None:
+            fields = _project(fields, field_paths)
+        document = _Document(
+            name=_join(prefix, path),
+            create_time=stored.create_time,
+            update_time=stored.update_time,
+        )
+        document.fields.MergeFrom(fields)
+        return types.Document.wrap(document)
+
+    def clear(self):
+        with self._lock:
+            self._collections.clear()
+
+    def document_paths(self, path, collection):
+        # every document in or below a collection, or below a document
+        prefix = path + "/"
+        with self._lock:
+            return [
+                _join(collection_path, doc_id)
+                for collection_path, documents in self._collections.items()
+                if (collection and collection_path == path)
+                or collection_path.startswith(prefix)
+                for doc_id in documents
+            ]
+
+    def batch_get_documents(self, request, metadata=None, **kwargs):
+        self._rpc("BatchGetDocuments")
+        request = types.BatchGetDocumentsRequest(request)
+        field_paths = list(request.mask.field_paths) if "mask" in request else None
+        responses = []
+        with self._lock:
+            read_time = self._now()
+            for name in request.documents:
+                prefix, path = _split_name(name)
+                stored = self._stored(path)
+                if stored is None:
+                    responses.append(
+                        types.BatchGetDocumentsResponse(
+                            missing=name, read_time=read_time
+                        )
+                    )
+                else:
+                    responses.append(
+                        types.BatchGetDocumentsResponse(
+                            found=self._document(prefix, path, stored, field_paths),
+                            read_time=read_time,
+                        )
+                    )
+        return iter(responses)
+
+    def _select(self, prefix, parent, query):
+        selector = query.from_[0]
+        if selector.all_descendants:
+            scope = parent + "/" if parent else ""
+            collections = [
+                (collection_path, documents)
+                for collection_path, documents in self._collections.items()
+                if collection_path.startswith(scope)
+                and collection_path.rpartition("/")[2] == selector.collection_id
+            ]
+        else:
+            collection_path = _join(parent, selector.collection_id)
+            collections = [
+                (collection_path, self._collections.get(collection_path, {}))
+            ]
+
+        rows = [
+            (_join(collection_path, doc_id), stored)
+            for collection_path, documents in collections
+            for doc_id, stored in documents.items()
+        ]
+        if query.HasField("where"):
+            rows = [row for row in rows if self._matches(prefix, *row, query.where)]
+
+        orders = [(order.field.field_path, order.direction) for order in query.order_by]
+        ordered = {field_path for field_path, _ in orders}
+        last_direction = orders[-1][1] if orders else _ASCENDING
+        if query.HasField("where"):
+            for field_path in sorted(_inequality_fields(query.where) - ordered):
+                orders.append((field_path, _ASCENDING))
+        if "__name__" not in ordered:
+            orders.append(("__name__", last_direction))
+
+        keyed = []
+        for path, stored in rows:
+            values = [self._field(prefix, path, stored, field) for field, _ in orders]
+            if all(value is not None for value in values):
+                keyed.append(([_key(value) for value in values], path, stored))
+        directions = [direction for _, direction in orders]
+
+        def compare(left, right):
+            for left_key, right_key, direction in zip(left, right, directions):
+                order = _compare(left_key, right_key)
+                if order:
+                    return order if direction == _ASCENDING else -order
+            return 0
+
+        keyed.sort(key=functools.cmp_to_key(lambda a, b: compare(a[0], b[0])))
+        # start_at and end_before cursors are inclusive of the cursor position
+        if query.HasField("start_at"):
+            cursor = [_key(value) for value in query.start_at.values]
+            lowest = 0 if query.start_at.before else 1
+            keyed = [row for row in keyed if compare(row[0], cursor) >= lowest]
+        if query.HasField("end_at"):
+            cursor = [_key(value) for value in query.end_at.values]
+            highest = -1 if query.end_at.before else 0
+            keyed = [row for row in keyed if compare(row[0], cursor) <= highest]
+        keyed = keyed[query.offset :]
+        if query.HasField("limit"):
+            keyed = keyed[: query.limit.value]
+        return [(path, stored) for _, path, stored in keyed]
+
+    def _field(self, prefix, path, stored, field_path):
+        if field_path == "__name__":
+            return _Value(reference_value=_join(prefix, path))
+        return _get_field(stored.fields.fields, parse_field_path(field_path))
+
+    def _matches(self, prefix, path, stored, where):
+        kind = where.WhichOneof("filter_type")
+        if kind == "composite_filter":
+            matches = (
+                self._matches(prefix, path, stored, child)
+                for child in where.composite_filter.filters
+            )
+            if (
+                where.composite_filter.op
+                == types.StructuredQuery.CompositeFilter.Operator.OR
+            ):
+                return any(matches)
+            return all(matches)
+
+        if kind == "unary_filter":
+            value = self._field(
+                prefix, path, stored, where.unary_filter.field.field_path
+            )
+            if value is None:
+                return False
+            key = _key(value)
+            return {
+                _UnaryOperator.IS_NAN: key == _NAN_KEY,
+                _UnaryOperator.IS_NULL: key == _NULL_KEY,
+                _UnaryOperator.IS_NOT_NAN: key != _NAN_KEY,
+                _UnaryOperator.IS_NOT_NULL: key != _NULL_KEY,
+            }[where.unary_filter.op]
+
+        field_filter = where.field_filter
+        value = self._field(prefix, path, stored, field_filter.field.field_path)
+        if value is None:
+            return False
+        key = _key(value)
+        operator = field_filter.op
+        if operator in _RANGE_OPERATORS:
+            expected = _key(field_filter.value)
+            return (
+                key[0] == expected[0]
+                and key != _NAN_KEY
+                and _RANGE_OPERATORS[operator](_compare(key, expected))
+            )
+        if operator == _Operator.EQUAL:
+            return key == _key(field_filter.value)
+        if operator == _Operator.NOT_EQUAL:
+            return key != _NULL_KEY and key != _key(field_filter.value)
+        if operator in (_Operator.IN, _Operator.NOT_IN, _Operator.ARRAY_CONTAINS_ANY):
+            expected = [
+                _key(element) for element in field_filter.value.array_value.values
+            ]
+            if operator == _Operator.IN:
+                return key in expected
+            if operator == _Operator.NOT_IN:
+                return key != _NULL_KEY and key not in expected
+        else:
+            expected = [_key(field_filter.value)]
+        return value.WhichOneof("value_type") == "array_value" and any(
+            _key(element) in expected for element in value.array_value.values
+        )
+
+    def run_query(self, request, metadata=None, **kwargs):
+        self._rpc("RunQuery")
+        request = types.RunQueryRequest(request)._pb
+        prefix, parent = _split_name(request.parent)
+        query = request.structured_query
+        field_paths = (
+            [field.field_path for field in query.select.fields]
+            if query.HasField("select")
+            else None
+        )
+        with self._lock:
+            read_time = self._now()
+            rows = self._select(prefix, parent, query)
+            responses = [
+                types.RunQueryResponse(
+                    document=self._document(prefix, path, stored, field_paths),
+                    read_time=read_time,
+                )
+                for path, stored in rows
+            ]
+        return iter(responses or [types.RunQueryResponse(read_time=read_time)])
+
+    def run_aggregation_query(self, request, metadata=None, **kwargs):
+        self._rpc("RunAggregationQuery")
+        request = types.RunAggregationQueryRequest(request)._pb
+        prefix, parent = _split_name(request.parent)
+        aggregation_query = request.structured_aggregation_query
+        with self._lock:
+            read_time = self._now()
+            rows = self._select(prefix, parent, aggregation_query.structured_query)
+        result = types.AggregationResult.pb()()
+        for aggregation in aggregation_query.aggregations:
+            kind = aggregation.WhichOneof("operator")
+            if kind == "count":
+                count = len(rows)
+                if aggregation.count.HasField("up_to"):
+                    count = min(count, aggregation.count.up_to.value)
+                value = _Value(integer_value=count)
+            else:
+                parts = parse_field_path(getattr(aggregation, kind).field.field_path)
+                values = [_get_field(stored.fields.fields, parts) for _, stored in rows]
+                values = [value for value in values if value is not None]
+                numbers = [_number(value) for value in values]
+                numbers = [number for number in numbers if number is not None]
+                if kind == "sum":
+                    integer = all(
+                        value.WhichOneof("value_type") == "integer_value"
+                        for value in values
+                        if _number(value) is not None
+                    )
+                    value = _number_value(sum(numbers), integer)
+                elif numbers:
+                    value = _Value(double_value=sum(numbers) / len(numbers))
+                else:
+                    value = _Value(null_value=0)
+            result.aggregate_fields[aggregation.alias].CopyFrom(value)
+        return iter(
+            [types.RunAggregationQueryResponse(result=result, read_time=read_time)]
+        )
+
+    def list_collection_ids(self, request, metadata=None, **kwargs):
+        self._rpc("ListCollectionIds")
+        _, path = _split_name(request["parent"])
+        prefix = path + "/"
+        with self._lock:
+            return sorted(
+                {
+                    collection_path[len(prefix) :].split("/", 1)[0]
+                    for collection_path, documents in self._collections.items()
+                    if documents and collection_path.startswith(prefix)
+                }
+            )
+
+    def begin_transaction(self, request, metadata=None, **kwargs):
+        self._rpc("BeginTransaction")
+        self._lock.acquire()
+        transaction = uuid.uuid4().bytes
+        self._transactions.add(transaction)
+        return types.BeginTransactionResponse(transaction=transaction)
+
+    def _end_transaction(self, transaction):
+        if transaction in self._transactions:
+            self._transactions.discard(transaction)
+            self._lock.release()
+
+    def rollback(self, request, metadata=None, **kwargs):
+        self._rpc("Rollback")
+        self._end_transaction(request["transaction"])
+
+    def commit(self, request, metadata=None, **kwargs):
+        self._rpc("Commit")
+        request = types.CommitRequest(request)._pb
+        try:
+            with self._lock:
+                commit_time = self._now()
+                staged = {}
+                results = [
+                    self._stage(write, commit_time, staged) for write in request.writes
+                ]
+                self._apply(staged, commit_time)
+        finally:
+            if request.transaction:
+                self._end_transaction(request.transaction)
+        return types.CommitResponse(write_results=results, commit_time=commit_time)
+
+    # unlike commit every write succeeds or fails on its own
+    def batch_write(self, request, metadata=None, **kwargs):
+        self._rpc("BatchWrite")
+        request = types.BatchWriteRequest(request)._pb
+        results = []
+        statuses = []
+        with self._lock:
+            for write in request.writes:
+                commit_time = self._now()
+                staged = {}
+                try:
+                    results.append(self._stage(write, commit_time, staged))
+                    statuses.append({"code": 0})
+                except exceptions.GoogleAPICallError as error:
+                    results.append(types.WriteResult.pb()())
+                    statuses.append({"code": error.grpc_status_code.value[0]})
+                    continue
+                self._apply(staged, commit_time)
+        return types.BatchWriteResponse(write_results=results, status=statuses)
+
+    def _stage(self, write, commit_time, staged):
+        operation = write.WhichOneof("operation")
+        name = write.update.name if operation == "update" else write.delete
+        _, path = _split_name(name)
+        current = staged[path] if path in staged else self._stored(path)
+
+        if write.HasField("current_document"):
+            condition = write.current_document
+            if condition.WhichOneof("condition_type") == "exists":
+                if condition.exists and current is None:
+                    raise exceptions.NotFound(f"No document to update: {name}")
+                if not condition.exists and current is not None:
+                    raise exceptions.AlreadyExists(f"Document already exists: {name}")
+            elif current is None or current.update_time != condition.update_time:
+                raise exceptions.FailedPrecondition(
+                    f"The document {name} was updated after the given update time"
+                )
+
+        if operation == "delete":
+            staged[path] = None
+            return types.WriteResult.pb()(update_time=commit_time)
+
+        fields = _MapValue()
+        if write.HasField("update_mask"):
+            if current is not None:
+                fields.CopyFrom(current.fields)
+            for field_path in write.update_mask.field_paths:
+                parts = parse_field_path(field_path)
+                value = _get_field(write.update.fields, parts)
+                if value is None:
+                    _delete_field(fields.fields, parts)
+                else:
+                    _set_field(fields.fields, parts, value)
+        else:
+            fields.fields.MergeFrom(write.update.fields)
+        transform_results = [
+            self._transform(fields.fields, transform, commit_time)
+            for transform in write.update_transforms
+        ]
+        staged[path] = _Stored(
+            fields, current.create_time if current else commit_time, commit_time
+        )
+        return types.WriteResult.pb()(
+            update_time=commit_time, transform_results=transform_results
+        )
+
+    def _transform(self, fields, transform, commit_time):
+        parts = parse_field_path(transform.field_path)
+        current = _get_field(fields, parts)
+        kind = transform.WhichOneof("transform_type")
+        if kind == "set_to_server_value":
+            value = _Value(timestamp_value=commit_time)
+        elif kind in ("increment", "maximum", "minimum"):
+            operand = getattr(transform, kind)
+            number = None if current is None else _number(current)
+            if number is None:
+                value = operand
+            else:
+                integer = (
+                    current.WhichOneof("value_type") == "integer_value"
+                    and operand.WhichOneof("value_type") == "integer_value"
+                )
+                combine = {
+                    "increment": lambda a, b: a + b,
+                    "maximum": max,
+                    "minimum": min,
+                }
+                value = _number_value(combine[kind](number, _number(operand)), integer)
+        else:
+            elements = (
+                list(current.array_value.values)
+                if current is not None
+                and current.WhichOneof("value_type") == "array_value"
+                else []
+            )
+            if kind == "append_missing_elements":
+                keys = [_key(element) for element in elements]
+                for element in transform.append_missing_elements.values:
+                    if _key(element) not in keys:
+                        elements.append(element)
+                        keys.append(_key(element))
+            else:
+                removed = [
+                    _key(element) for element in transform.remove_all_from_array.values
+                ]
+                elements = [
+                    element for element in elements if _key(element) not in removed
+                ]
+            value = _Value()
+            value.array_value.SetInParent()
+            value.array_value.values.extend(elements)
+        _set_field(fields, parts, value)
+        return value
+
+    def _apply(self, staged, commit_time):
+        changes = []
+        for path, stored in staged.items():
+            collection_path, _, doc_id = path.rpartition("/")
+            documents = self._collections.get(collection_path, {})
+            existed = doc_id in documents
+            if stored is None:
+                if not existed:
+                    continue
+                del documents[doc_id]
+                if not documents:
+                    del self._collections[collection_path]
+            else:
+                self._collections.setdefault(collection_path, documents)[
+                    doc_id
+                ] = stored
+            changes.append((collection_path, doc_id, existed, stored))
+        for watch in list(self._watches):
+            self._notify(
+                watch,
+                [change for change in changes if change[0] == watch.path],
+                commit_time,
+            )
+
+    # listeners are called synchronously once the write is applied, with the
+    # same arguments the library passes to on_snapshot callbacks
+    def _notify(self, watch, changes, read_time, initial=False):
+        if not changes and not initial:
+            return
+        snapshots = [
+            watch.snapshot(doc_id, stored, read_time)
+            for doc_id, stored in self._collections.get(watch.path, {}).items()
+        ]
+        document_changes = []
+        for _, doc_id, existed, stored in changes:
+            if stored is None:
+                document = DocumentSnapshot(
+                    watch.collection.document(doc_id),
+                    None,
+                    exists=False,
+                    read_time=read_time,
+                    create_time=None,
+                    update_time=None,
+                )
+                change_type = ChangeType.REMOVED
+            else:
+                document = watch.snapshot(doc_id, stored, read_time)
+                change_type = ChangeType.MODIFIED if existed else ChangeType.ADDED
+            document_changes.append(DocumentChange(change_type, document, -1, -1))
+        watch.callback(snapshots, document_changes, read_time)
+
+    def watch(self, collection, callback):
+        watch = _Watch(self, collection, callback)
+        with self._lock:
+            self._watches.append(watch)
+            read_time = self._now()
+            changes = [
+                (watch.path, doc_id, False, stored)
+                for doc_id, stored in self._collections.get(watch.path, {}).items()
+            ]
+            self._notify(watch, changes, read_time, initial=True)
+        return watch
+
+    def unwatch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+
+class _MemoryCollectionReference(CollectionReference):
+    def on_snapshot(self, callback):
+        return self._client._firestore_api.watch(self, callback)
+
+
+class MemoryClient(firestore.Client):
+    # a firestore client whose rpcs are served by a MemoryFirestore, clients
+    # sharing a store see the same documents
+    def __init__(self, store, project=None):
+        super().__init__(
+            project=project or os.environ.get("GCLOUD_PROJECT", "test-project"),
+            credentials=AnonymousCredentials(),
+        )
+        self._store = store
+
+    @property
+    def _firestore_api(self):
+        return self._store
+
+    def collection(self, *collection_path):
+        return _MemoryCollectionReference(*_path_helper(collection_path), client=self)
+
+    # deletes straight from the store instead of paging through the documents
+    # with a bulk writer, the deletes are still sent in batches of 20
+    def recursive_delete(self, reference, *, bulk_writer=None, chunk_size=5000):
+        path = "/".join(reference._path)
+        is_collection = isinstance(reference, CollectionReference)
+        paths = self._store.document_paths(path, is_collection)
+        if not is_collection:
+            paths.append(path)
+        writes = [
+            _helpers.pb_for_delete(self.document(doc_path)._document_path, None)
+            for doc_path in paths
+        ]
+        iterator = iter(writes)
+        for chunk in iter(lambda: list(itertools.islice(iterator, 20)), []):
+            self._store.batch_write(
+                request={"database": self._database_string, "writes": chunk}
+            )
+        return len(paths)
@@ -0,0 +1,184 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+import flask
+from flask import Blueprint
+from .cache import document_cache, query_cache
+from .firestore_db import add_rpc_listener
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RPC_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+metrics_blueprint = Blueprint("metrics", __name__)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bucket, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield bucket, total
+
+
+class FirestoreCalls:
+    # the firestore rpcs made while serving one request, rpcs finish on grpc
+    # threads so updates are locked
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_seconds = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.requests = defaultdict(int)
+        self.request_rpcs = defaultdict(lambda: Histogram(RPC_COUNT_BUCKETS))
+        self.request_rpc_seconds = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.rpcs = defaultdict(int)
+        self.rpc_seconds = defaultdict(float)
+
+    def observe_request(self, method, route, status, seconds, calls):
+        with self._lock:
+            self.request_seconds[(method, route)].observe(seconds)
+            self.requests[(method, route, str(status))] += 1
+            self.request_rpcs[(method, route)].observe(calls.count)
+            self.request_rpc_seconds[(method, route)].observe(calls.seconds)
+
+    def observe_rpc(self, method, seconds):
+        with self._lock:
+            self.rpcs[method] += 1
+            self.rpc_seconds[method] += seconds
+
+    def render(self):
+        lines = []
+        with self._lock:
+            _histogram(
+                lines,
+                "http_request_duration_seconds",
+                ("method", "route"),
+                self.request_seconds,
+            )
+            _counter(
+                lines,
+                "http_requests_total",
+                ("method", "route", "status"),
+                self.requests,
+            )
+            _histogram(
+                lines,
+                "firestore_request_rpcs",
+                ("method", "route"),
+                self.request_rpcs,
+            )
+            _histogram(
+                lines,
+                "firestore_request_rpc_seconds",
+                ("method", "route"),
+                self.request_rpc_seconds,
+            )
+            _counter(lines, "firestore_rpcs_total", ("rpc",), self.rpcs)
+            _counter(lines, "firestore_rpc_seconds_total", ("rpc",), self.rpc_seconds)
+        for name, cache in [
+            ("document_cache", document_cache),
+            ("query_cache", query_cache),
+        ]:
+            for stat, value in cache.stats().items():
+                kind = "gauge" if stat == "size" else "counter"
+                suffix = "" if stat == "size" else "_total"
+                lines.append(f"# TYPE {name}_{stat}{suffix} {kind}")
+                lines.append(f"{name}_{stat}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _counter(lines, name, label_names, values):
+    lines.append(f"# TYPE {name} counter")
+    for label_values, value in sorted(values.items()):
+        lines.append(f"{name}{{{_labels(label_names, label_values)}}} {value}")
+
+
+def _histogram(lines, name, label_names, histograms):
+    lines.append(f"# TYPE {name} histogram")
+    for label_values, histogram in sorted(histograms.items()):
+        for bucket, count in histogram.cumulative():
+            labels = _labels(label_names, label_values, le=bucket)
+            lines.append(f"{name}_bucket{{{labels}}} {count}")
+        labels = _labels(label_names, label_values)
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+registry = Registry()
+
+
+def _on_rpc(method):
+    calls = None
+    if flask.has_app_context():
+        if "firestore_calls" not in flask.g:
+            flask.g.firestore_calls = FirestoreCalls()
+        calls = flask.g.firestore_calls
+
+    def done(seconds):
+        registry.observe_rpc(method, seconds)
+        if calls is not None:
+            calls.observe(seconds)
+
+    return done
+
+
+def _start_timer():
+    flask.g.request_started = time.perf_counter()
+
+
+def _observe_request(response):
+    started = flask.g.get("request_started")
+    if started is not None:
+        route = flask.request.url_rule.rule if flask.request.url_rule else "unmatched"
+        registry.observe_request(
+            flask.request.method,
+            route,
+            response.status_code,
+            time.perf_counter() - started,
+            flask.g.get("firestore_calls", FirestoreCalls()),
+        )
+    return response
+
+
+def init_app(app):
+    add_rpc_listener(_on_rpc)
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+
+
+@metrics_blueprint.route("/")
+def metrics():
+    return flask.Response(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
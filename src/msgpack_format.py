@@ -0,0 +1,55 @@
+import flask
+import msgpack
+from werkzeug.exceptions import BadRequest
+from .json_provider import FirestoreJSONProvider, firestore_default
+
+# messagepack as an alternative wire format for clients that ask for it, reads
+# negotiate it with the Accept header and writes send it with the Content-Type
+# header, values are converted the same way as for json so decoding either
+# format gives the same objects
+MSGPACK_MIMETYPE = "application/msgpack"
+
+
+def wants_msgpack():
+    if not flask.has_request_context():
+        return False
+    best = flask.request.accept_mimetypes.best_match(
+        ["application/json", MSGPACK_MIMETYPE]
+    )
+    return best == MSGPACK_MIMETYPE
+
+
+def packb(obj):
+    return msgpack.packb(obj, default=firestore_default)
+
+
+class NegotiatingJSONProvider(FirestoreJSONProvider):
+    # jsonify answers in messagepack when the client prefers it
+    def response(self, *args, **kwargs):
+        if wants_msgpack():
+            response = self._app.response_class(
+                packb(self._prepare_response_obj(args, kwargs)),
+                mimetype=MSGPACK_MIMETYPE,
+            )
+        else:
+            response = super().response(*args, **kwargs)
+        response.vary.add("Accept")
+        return response
+
+
+class MsgpackRequest(flask.Request):
+    # request.json decodes a messagepack body so handlers read either format
+    def get_json(self, force=False, silent=False, cache=True):
+        if self.mimetype != MSGPACK_MIMETYPE:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        if cache and "_cached_msgpack" in self.__dict__:
+            return self._cached_msgpack
+        try:
+            body = msgpack.unpackb(self.get_data(cache=cache))
+        except (ValueError, msgpack.UnpackException) as e:
+            if silent:
+                return None
+            raise BadRequest(f"Failed to decode MessagePack object: {e}")
+        if cache:
+            self._cached_msgpack = body
+        return body
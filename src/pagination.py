@@ -0,0 +1,102 @@
+import base64
+import json
+import flask
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+NEXT_PAGE_TOKEN_HEADER = "X-Next-Page-Token"
+
+
+def encode_page_token(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_page_token(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"Invalid page token: {token}")
+    return values
+
+
+class Page:
+    # applies the limit, start_after, order_by and fields query arguments to a
+    # query, order_by takes a field name optionally prefixed with "-" for
+    # descending order and results are always tie broken on the document id so
+    # the page token can be a plain (value, id) cursor
+    def __init__(self, args, default_order_by=None):
+        self.fields = None
+        self.limit = None
+        self.order_by = args.get("order_by", default_order_by)
+        self.direction = firestore.Query.ASCENDING
+        self.start_after = None
+
+        if args.get("fields"):
+            self.fields = [field.strip() for field in args["fields"].split(",")]
+        if args.get("limit") is not None:
+            self.limit = int(args["limit"])
+            if self.limit <= 0:
+                raise ValueError(f"Invalid limit: {self.limit}")
+        if self.order_by is not None and self.order_by.startswith("-"):
+            self.order_by = self.order_by[1:]
+            self.direction = firestore.Query.DESCENDING
+        if args.get("start_after"):
+            self.start_after = decode_page_token(args["start_after"])
+
+    # true when the whole result is asked for in ascending order_by order
+    def is_plain(self, order_by=None):
+        return (
+            not self.paginated
+            and self.fields is None
+            and self.order_by == order_by
+            and self.direction == firestore.Query.ASCENDING
+        )
+
+    @property
+    def paginated(self):
+        return self.limit is not None or self.start_after is not None
+
+    def apply(self, query):
+        if self.fields is not None:
+            fields = list(self.fields)
+            if self.order_by is not None and self.order_by not in fields:
+                fields.append(self.order_by)
+            query = query.select(fields)
+
+        if not self.paginated:
+            if self.order_by is not None:
+                query = query.order_by(self.order_by, direction=self.direction)
+            return query
+
+        cursor = (
+            {FieldPath.document_id(): self.start_after[-1]}
+            if self.start_after
+            else None
+        )
+        if self.order_by is not None:
+            query = query.order_by(self.order_by, direction=self.direction)
+            if cursor is not None:
+                cursor = {self.order_by: self.start_after[0], **cursor}
+        query = query.order_by(FieldPath.document_id(), direction=self.direction)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        return query
+
+    def next_page_token(self, snapshots):
+        if self.limit is None or len(snapshots) < self.limit:
+            return None
+        last = snapshots[-1]
+        if self.order_by is None:
+            return encode_page_token([last.id])
+        return encode_page_token([last.get(self.order_by), last.id])
+
+    def response(self, snapshots):
+        response = flask.jsonify([snapshot.to_dict() for snapshot in snapshots])
+        token = self.next_page_token(snapshots)
+        if token is not None:
+            response.headers[NEXT_PAGE_TOKEN_HEADER] = token
+        return response
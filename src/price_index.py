@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from . import background
+
+PRICE_INDEX_ENABLED = os.environ.get("PRICE_INDEX", "0").lower() in ("1", "true")
+# an index is reloaded in the background after this many seconds even while a
+# listener keeps it current, so a missed change cannot live on in it
+PRICE_INDEX_TTL = float(os.environ.get("PRICE_INDEX_TTL", "60"))
+
+
+class PriceIndex:
+    # (price, document id) pairs of one collection kept sorted in two parallel
+    # arrays so a price range is two bisects and a slice
+    def __init__(self, entries=()):
+        entries = sorted(
+            (float(price), doc_id) for doc_id, price in entries if _is_price(price)
+        )
+        self._prices = array("d", [price for price, _ in entries])
+        self._ids = [doc_id for _, doc_id in entries]
+        self._by_id = {doc_id: price for price, doc_id in entries}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _find(self, doc_id, price):
+        index = bisect_left(self._prices, price)
+        while self._ids[index] != doc_id:
+            index += 1
+        return index
+
+    def _remove(self, doc_id):
+        price = self._by_id.pop(doc_id, None)
+        if price is None:
+            return
+        index = self._find(doc_id, price)
+        del self._prices[index]
+        del self._ids[index]
+
+    def upsert(self, doc_id, price):
+        with self._lock:
+            # a listener replays every document when it starts, most of them
+            # with the price the index already holds
+            if _is_price(price) and self._by_id.get(doc_id) == float(price):
+                return
+            self._remove(doc_id)
+            if not _is_price(price):
+                return
+            price = float(price)
+            index = bisect_right(self._prices, price)
+            self._prices.insert(index, price)
+            self._ids.insert(index, doc_id)
+            self._by_id[doc_id] = price
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def range(self, min_price=None, max_price=None):
+        with self._lock:
+            start = 0 if min_price is None else bisect_left(self._prices, min_price)
+            end = (
+                len(self._prices)
+                if max_price is None
+                else bisect_right(self._prices, max_price)
+            )
+            return self._ids[start:end]
+
+
+class PriceIndexes:
+    # one index per collection path, collections are loaded on a background
+    # thread and then kept current by the write paths and the snapshot
+    # listener, writes made by other workers only reach an index through the
+    # listener so an index is only served for collections a listener covers
+    def __init__(self, enabled=PRICE_INDEX_ENABLED, ttl=PRICE_INDEX_TTL):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._indexes = {}
+        # the writes recorded while a collection is loaded, by collection path
+        self._loading = {}
+        self._watched = set()
+        # set by the snapshot listener, called with every collection path asked
+        # for to start listening to it or to keep listening to it
+        self.watch = None
+        self._lock = threading.Lock()
+
+    def covers(self, collection_path):
+        if not self.enabled:
+            return False
+        if self.watch is not None:
+            self.watch(collection_path)
+        return self.is_watched(collection_path)
+
+    def is_watched(self, collection_path):
+        return collection_path in self._watched
+
+    def watched(self, collection_path):
+        with self._lock:
+            self._watched.add(collection_path)
+
+    def unwatch(self, collection_path):
+        with self._lock:
+            self._watched.discard(collection_path)
+        self.drop(collection_path)
+
+    def unwatch_all(self):
+        with self._lock:
+            self._watched.clear()
+            self.watch = None
+
+    # the index of the collection or None before its first load completed, an
+    # expired index is still served while it is reloaded
+    def get(self, collection_path):
+        entry = self._indexes.get(collection_path)
+        return None if entry is None else entry[0]
+
+    # starts loading the collection from snapshots, a callable returning its
+    # documents, on a background thread when its index is missing or expired
+    # and it is not being loaded already
+    def load_when_stale(self, collection_path, snapshots):
+        with self._lock:
+            entry = self._indexes.get(collection_path)
+            if collection_path in self._loading or (
+                entry is not None and time.monotonic() < entry[1]
+            ):
+                return
+            writes = self._loading[collection_path] = []
+        background.submit(self._load, collection_path, snapshots, writes)
+
+    def _load(self, collection_path, snapshots, writes):
+        try:
+            index = PriceIndex(
+                (snapshot.id, snapshot.to_dict().get("price"))
+                for snapshot in snapshots()
+                if snapshot.exists
+            )
+        except Exception:
+            with self._lock:
+                if self._loading.get(collection_path) is writes:
+                    del self._loading[collection_path]
+            raise
+        with self._lock:
+            # dropped while it was loading
+            if self._loading.get(collection_path) is not writes:
+                return
+            del self._loading[collection_path]
+            # writes recorded during the load may not be in the snapshots
+            for doc_id, price in writes:
+                index.upsert(doc_id, price)
+            self._indexes[collection_path] = (index, time.monotonic() + self.ttl)
+
+    # replace is set for writes that overwrite the whole document, a document
+    # without a price then drops out of the index
+    def record_write(self, collection_path, doc_id, data, replace=False):
+        if replace or "price" in data:
+            self._record(collection_path, doc_id, data.get("price"))
+
+    def record_delete(self, collection_path, doc_id):
+        self._record(collection_path, doc_id, None)
+
+    def _record(self, collection_path, doc_id, price):
+        with self._lock:
+            if collection_path in self._loading:
+                self._loading[collection_path].append((doc_id, price))
+            index = self.get(collection_path)
+        if index is not None:
+            index.upsert(doc_id, price)
+
+    def drop(self, collection_path):
+        with self._lock:
+            self._indexes.pop(collection_path, None)
+            self._loading.pop(collection_path, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._loading.clear()
+
+
+def _is_price(price):
+    return isinstance(price, (int, float)) and not isinstance(price, bool)
+
+
+def in_price_range(price, min_price=None, max_price=None):
+    return (
+        _is_price(price)
+        and (min_price is None or price >= min_price)
+        and (max_price is None or price <= max_price)
+    )
+
+
+price_indexes = PriceIndexes()
@@ -1,17 +1,58 @@
 import flask
 from flask import Blueprint
+from google.api_core.exceptions import (
+    FailedPrecondition,
+    GoogleAPICallError,
+    NotFound,
+)
 from google.cloud.firestore_v1.base_query import FieldFilter
+from .conditional import document_response, if_match_update_time
 from .firestore_db import firestore_db
+from .pagination import Page
+from .streaming import stream_response, wants_stream
+from .documents import (
+    add_document,
+    delete_document,
+    get_aggregation,
+    get_cached_aggregation,
+    get_cached_document,
+    get_cached_documents,
+    get_cached_query,
+    get_document,
+    get_price_range,
+    get_query,
+    serves_price_range,
+    set_documents,
+    stream_query,
+    update_document,
+    update_documents,
+)
 
 products_blueprint = Blueprint("products", __name__)
 
 PRODUCTS_COLLECTION_NAME = "products"
+MAX_LOOKUP_IDS = 1000
+# shop copies of a product carry its id so they can be found with a collection
+# group query, quantity only exists on the copies
+PRODUCT_ID_FIELD = "product_id"
+SHOP_PRODUCT_FIELDS = {"quantity", PRODUCT_ID_FIELD}
+
+
+def new_product_from(body):
+    return {
+        "name": body["name"],
+        "description": body["description"],
+        "price": body["price"],
+    }
 
 
 # TODO: try and use type enumerations for methods
 @products_blueprint.route("/", methods=["GET", "POST"])
 def products():
     if flask.request.method == "GET":
+        if flask.request.args.get("ids"):
+            return lookup_products(flask.request.args["ids"].split(","))
+
         min_price = flask.request.args.get("min_price", None)
         max_price = flask.request.args.get("max_price", None)
 
@@ -27,60 +68,296 @@ def products():
         if max_price is not None:
             query = query.where(filter=FieldFilter("price", "<=", max_price))
 
-        products_query = query.get()
-        products_list = [product.to_dict() for product in products_query]
-        return flask.jsonify(products_list)
+        try:
+            # firestore needs range filtered queries ordered by the filtered field
+            page = Page(
+                flask.request.args,
+                default_order_by=(
+                    "price" if min_price is not None or max_price is not None else None
+                ),
+            )
+        except ValueError as e:
+            return flask.Response(status=400, response=str(e))
+
+        query = page.apply(query)
+        if wants_stream():
+            return stream_response(stream_query(query))
+
+        filtered = min_price is not None or max_price is not None
+        products_collection = firestore_db.collection(PRODUCTS_COLLECTION_NAME)
+        if (
+            filtered
+            and page.is_plain("price")
+            and serves_price_range(products_collection)
+        ):
+            products_query = get_price_range(products_collection, min_price, max_price)
+        elif filtered and page.is_plain("price"):
+            products_query = get_cached_query(
+                products_collection, (min_price, max_price), query
+            )
+        else:
+            products_query = get_query(query)
+        return page.response(products_query)
 
     if flask.request.method == "POST":
         try:
-            product_name = flask.request.json["name"]
-            product_description = flask.request.json["description"]
-            product_price = flask.request.json["price"]
+            new_product = new_product_from(flask.request.json)
         except KeyError as e:
             return flask.Response(
                 status=400, response=f"Missing required key in the body: {e}"
             )
-        new_product = {
-            "name": product_name,
-            "description": product_description,
-            "price": product_price,
-        }
-        _, product_ref = firestore_db.collection(PRODUCTS_COLLECTION_NAME).add(
-            new_product
+        product_ref = add_document(
+            firestore_db.collection(PRODUCTS_COLLECTION_NAME), new_product
         )
         return flask.jsonify({"id": product_ref.id})
 
     return flask.Response(status=405)
 
 
+# copies the updated catalogue fields of a product to every shop that stocks it,
+# copies removed meanwhile are skipped
+def propagate_product_update(product_id, data):
+    fields = {
+        key: value for key, value in data.items() if key not in SHOP_PRODUCT_FIELDS
+    }
+    if not fields:
+        return
+    copies = get_query(
+        firestore_db.collection_group(PRODUCTS_COLLECTION_NAME)
+        .where(filter=FieldFilter(PRODUCT_ID_FIELD, "==", str(product_id)))
+        .select([])
+    )
+    update_documents([copy.reference for copy in copies], fields)
+
+
+# the copies of products stocked by shops, the catalogue products share the
+# collection id but carry no product id, so they are filtered out with an
+# equality on it or dropped by ordering on it, every shape of this query is
+# covered by an index in firestore.indexes.json
+def shop_copies_query(product_id=None, min_price=None, max_price=None):
+    query = firestore_db.collection_group(PRODUCTS_COLLECTION_NAME)
+    if product_id is not None:
+        query = query.where(filter=FieldFilter(PRODUCT_ID_FIELD, "==", product_id))
+    if min_price is not None:
+        query = query.where(filter=FieldFilter("price", ">=", min_price))
+    if max_price is not None:
+        query = query.where(filter=FieldFilter("price", "<=", max_price))
+    if min_price is not None or max_price is not None:
+        query = query.order_by("price")
+    if product_id is None:
+        query = query.order_by(PRODUCT_ID_FIELD)
+    return query
+
+
+# answers a filtered collection group query over the shop copies with the shop
+# of each copy, args may carry min_price, max_price and limit
+def shop_copies_response(args, product_id=None):
+    try:
+        min_price = _optional(args, "min_price", _parse_float)
+        max_price = _optional(args, "max_price", _parse_float)
+        limit = _optional(args, "limit", _parse_limit)
+    except ValueError as e:
+        return flask.Response(status=400, response=str(e))
+
+    query = shop_copies_query(product_id, min_price, max_price)
+    if limit is not None:
+        query = query.limit(limit)
+    # a catalogue product written with a product id before those were refused
+    # matches as well, only copies have a shop above them
+    return flask.jsonify(
+        [
+            {"shop_id": snapshot.reference.parent.parent.id, **snapshot.to_dict()}
+            for snapshot in get_query(query)
+            if snapshot.reference.parent.parent is not None
+        ]
+    )
+
+
+# count, total and average price of the products of a collection within the
+# price range in args from one aggregation rpc, cached=1 serves the rollup from
+# the query cache which a write to the collection invalidates
+def price_stats_response(collection, args):
+    try:
+        min_price = _optional(args, "min_price", _parse_float)
+        max_price = _optional(args, "max_price", _parse_float)
+    except ValueError as e:
+        return flask.Response(status=400, response=str(e))
+
+    query = collection
+    if min_price is not None:
+        query = query.where(filter=FieldFilter("price", ">=", min_price))
+    if max_price is not None:
+        query = query.where(filter=FieldFilter("price", "<=", max_price))
+
+    if args.get("cached", "").lower() in ("1", "true"):
+        stats = get_cached_aggregation(
+            collection, (min_price, max_price), query, "price"
+        )
+    else:
+        stats = get_aggregation(query, "price")
+    return flask.jsonify(stats)
+
+
+def _optional(args, key, parse):
+    value = args.get(key, None)
+    return None if value is None else parse(value)
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid number: {value}")
+
+
+def _parse_limit(value):
+    if not value.isdigit() or int(value) <= 0:
+        raise ValueError(f"Invalid limit: {value}")
+    return int(value)
+
+
+@products_blueprint.route("/batch", methods=["POST"])
+def products_batch():
+    items = flask.request.json
+    if not isinstance(items, list):
+        return flask.Response(
+            status=400, response="Expected a list of products in the body"
+        )
+
+    # validate everything before writing anything
+    new_products = []
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "Expected a product object"})
+            continue
+        try:
+            new_products.append(new_product_from(item))
+        except KeyError as e:
+            errors.append(
+                {"index": index, "error": f"Missing required key in the body: {e}"}
+            )
+    if errors:
+        return flask.make_response(flask.jsonify(errors), 400)
+
+    products_collection = firestore_db.collection(PRODUCTS_COLLECTION_NAME)
+    writes = [(products_collection.document(), product) for product in new_products]
+    set_documents(writes)
+    return flask.jsonify([{"id": reference.id} for reference, _ in writes])
+
+
+@products_blueprint.route("/lookup", methods=["POST"])
+def products_lookup():
+    body = flask.request.json
+    ids = body.get("ids") if isinstance(body, dict) else None
+    if not isinstance(ids, list):
+        return flask.Response(
+            status=400, response="Expected a list of ids in the body under the ids key"
+        )
+    return lookup_products(ids)
+
+
+# resolves every id with one get_all call, found products keep the order of the
+# ids and unknown ids are reported as missing
+def lookup_products(ids):
+    ids = [str(product_id).strip() for product_id in ids if str(product_id).strip()]
+    if len(ids) > MAX_LOOKUP_IDS:
+        return flask.Response(
+            status=400,
+            response=f"At most {MAX_LOOKUP_IDS} ids can be looked up at once",
+        )
+
+    products_collection = firestore_db.collection(PRODUCTS_COLLECTION_NAME)
+    snapshots = get_cached_documents(
+        [products_collection.document(product_id) for product_id in ids]
+    )
+    return flask.jsonify(
+        {
+            "products": [
+                {"id": snapshot.id, **snapshot.to_dict()}
+                for snapshot in snapshots
+                if snapshot.exists
+            ],
+            "missing": [snapshot.id for snapshot in snapshots if not snapshot.exists],
+        }
+    )
+
+
+@products_blueprint.route("/stats", methods=["GET"])
+def products_stats():
+    return price_stats_response(
+        firestore_db.collection(PRODUCTS_COLLECTION_NAME), flask.request.args
+    )
+
+
+# the shops stocking a product, one indexed collection group query instead of
+# listing the products of every shop
+@products_blueprint.route("/<product_id>/shops", methods=["GET"])
+def product_shops(product_id):
+    return shop_copies_response(flask.request.args, str(product_id))
+
+
 @products_blueprint.route("/<product_id>", methods=["GET", "PUT", "DELETE"])
 def product_id(product_id):
     if flask.request.method == "GET":
         product_doc = firestore_db.collection(PRODUCTS_COLLECTION_NAME).document(
             str(product_id)
         )
-        if not product_doc.get().exists:
+        product_snapshot = get_cached_document(product_doc)
+        if not product_snapshot.exists:
             return flask.Response(status=404)
-        return flask.jsonify(product_doc.get().to_dict())
+        return document_response(product_snapshot)
 
     if flask.request.method == "PUT":
+        # the fields of shop copies would make the product match the collection
+        # group queries over the copies
+        body = flask.request.json
+        shop_fields = SHOP_PRODUCT_FIELDS.intersection(
+            body if isinstance(body, dict) else {}
+        )
+        if shop_fields:
+            return flask.Response(
+                status=400,
+                response=f"Fields of shop products cannot be set on a product: {', '.join(sorted(shop_fields))}",
+            )
         product_doc = firestore_db.collection(PRODUCTS_COLLECTION_NAME).document(
             str(product_id)
         )
-        if not product_doc.get().exists:
-            return flask.Response(status=404)
-
-        for key, value in flask.request.json.items():
-            product_doc.get().reference.update({key: value})
-        return flask.Response(status=200)
+        try:
+            last_update_time = if_match_update_time(product_doc)
+            if not update_document(product_doc, flask.request.json, last_update_time):
+                return flask.Response(status=404)
+        except FailedPrecondition:
+            if flask.request.if_match:
+                return flask.Response(
+                    status=412,
+                    response=f"Product with id {product_id} does not match If-Match",
+                )
+            return flask.Response(
+                status=409, response=f"Product with id {product_id} was modified"
+            )
+        # the product is updated by now, so a failure to update its copies is
+        # reported next to it instead of failing the request
+        try:
+            propagate_product_update(product_id, flask.request.json)
+        except GoogleAPICallError as e:
+            return flask.jsonify({"id": product_id, "propagation_error": str(e)})
+        return flask.jsonify({"id": product_id})
 
     if flask.request.method == "DELETE":
         product_doc = firestore_db.collection(PRODUCTS_COLLECTION_NAME).document(
             str(product_id)
         )
-        if not product_doc.get().exists:
-            return flask.Response(status=404)
-        product_doc.get().reference.delete()
+        try:
+            last_update_time = if_match_update_time(product_doc)
+            if last_update_time is None and not get_document(product_doc).exists:
+                return flask.Response(status=404)
+            delete_document(product_doc, last_update_time)
+        except (FailedPrecondition, NotFound):
+            return flask.Response(
+                status=412,
+                response=f"Product with id {product_id} does not match If-Match",
+            )
         return flask.Response(status=200)
 
     return flask.Response(status=405)
@@ -1,11 +1,47 @@
 import flask
 from flask import Blueprint
+from .conditional import (
+    document_response,
+    if_match_update_time,
+    listing_etag,
+    listing_response,
+    not_modified,
+)
 from .firestore_db import firestore_db
-from .products import PRODUCTS_COLLECTION_NAME
+from .documents import (
+    add_document,
+    delete_document,
+    delete_document_tree,
+    get_cached_document,
+    get_cached_query,
+    get_document,
+    get_documents,
+    get_price_range,
+    get_query,
+    get_query_versions,
+    increment_document,
+    prefetch_documents,
+    serves_price_range,
+    set_document,
+    set_documents,
+    stream_query,
+    update_document,
+)
+from .products import (
+    PRODUCTS_COLLECTION_NAME,
+    PRODUCT_ID_FIELD,
+    price_stats_response,
+)
+from .pagination import Page
+from .streaming import stream_response, wants_stream
 from google.cloud.firestore_v1.base_query import FieldFilter
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud import firestore
+from . import background
 
 
 SHOP_COLLECTION_NAME = "shops"
+SHOP_DELETIONS_COLLECTION_NAME = "shop_deletions"
 
 shop_blueprint = Blueprint("shop", __name__)
 
@@ -13,9 +49,13 @@ shop_blueprint = Blueprint("shop", __name__)
 @shop_blueprint.route("/", methods=["GET", "POST"])
 def shop():
     if flask.request.method == "GET":
-        shops = firestore_db.collection(SHOP_COLLECTION_NAME).get()
-        shops_list = [shop.to_dict() for shop in shops]
-        return flask.jsonify(shops_list)
+        try:
+            page = Page(flask.request.args)
+        except ValueError as e:
+            return flask.Response(status=400, response=str(e))
+
+        shops = get_query(page.apply(firestore_db.collection(SHOP_COLLECTION_NAME)))
+        return page.response(shops)
 
     if flask.request.method == "POST":
         try:
@@ -30,7 +70,7 @@ def shop():
             "name": shop_name,
             "address": shop_address,
         }
-        _, shop_ref = firestore_db.collection(SHOP_COLLECTION_NAME).add(new_shop)
+        shop_ref = add_document(firestore_db.collection(SHOP_COLLECTION_NAME), new_shop)
         return flask.jsonify({"id": shop_ref.id})
 
     return flask.Response(status=405)
@@ -40,34 +80,89 @@ def shop():
 def shop_id(shop_id):
     if flask.request.method == "GET":
         shop_doc = firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id))
-        if not shop_doc.get().exists:
+        shop_snapshot = get_cached_document(shop_doc)
+        if not shop_snapshot.exists:
             return flask.Response(status=404)
-        return flask.jsonify(shop_doc.get().to_dict())
+        return document_response(shop_snapshot)
     if flask.request.method == "PUT":
         shop_doc = firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id))
-        if not shop_doc.get().exists:
-            return flask.Response(status=404)
-
-        for key, value in flask.request.json.items():
-            shop_doc.get().reference.update({key: value})
+        try:
+            if not update_document(shop_doc, flask.request.json):
+                return flask.Response(status=404)
+        except FailedPrecondition:
+            return flask.Response(
+                status=409, response=f"Shop with id {shop_id} was modified"
+            )
         return flask.Response(status=200)
     if flask.request.method == "DELETE":
         shop_doc = firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id))
-        if not shop_doc.get().exists:
+        if not get_document(shop_doc).exists:
             return flask.Response(status=404)
-        shop_doc.get().reference.delete()
+
+        if flask.request.args.get("background", "").lower() in ("1", "true"):
+            # the status lives in firestore so any worker can report on it
+            firestore_db.collection(SHOP_DELETIONS_COLLECTION_NAME).document(
+                str(shop_id)
+            ).set({"status": "running", "started_at": firestore.SERVER_TIMESTAMP})
+            background.submit(delete_shop, str(shop_id))
+            response = flask.jsonify({"id": shop_id, "status": "running"})
+            response.status_code = 202
+            response.headers["Location"] = f"/shop/{shop_id}/deletion"
+            return response
+
+        delete_document_tree(shop_doc)
         return flask.Response(status=200)
 
     return flask.Response(status=405)
 
 
+# deletes a shop together with its products subcollection, run as a background
+# job for shops too large to delete within a request
+def delete_shop(shop_id):
+    status_doc = firestore_db.collection(SHOP_DELETIONS_COLLECTION_NAME).document(
+        shop_id
+    )
+    try:
+        deleted = delete_document_tree(
+            firestore_db.collection(SHOP_COLLECTION_NAME).document(shop_id)
+        )
+    except Exception as e:
+        status_doc.set(
+            {
+                "status": "failed",
+                "error": str(e),
+                "finished_at": firestore.SERVER_TIMESTAMP,
+            },
+            merge=True,
+        )
+        raise
+    status_doc.set(
+        {
+            "status": "done",
+            "deleted": deleted,
+            "finished_at": firestore.SERVER_TIMESTAMP,
+        },
+        merge=True,
+    )
+
+
+@shop_blueprint.route("/<shop_id>/deletion", methods=["GET"])
+def shop_deletion(shop_id):
+    status_snapshot = get_document(
+        firestore_db.collection(SHOP_DELETIONS_COLLECTION_NAME).document(str(shop_id))
+    )
+    if not status_snapshot.exists:
+        return flask.Response(status=404)
+    return flask.jsonify({"id": shop_id, **status_snapshot.to_dict()})
+
+
 @shop_blueprint.route("/<shop_id>/products", methods=["GET"])
 def shop_products(shop_id):
     if flask.request.method == "GET":
         shop_document = firestore_db.collection(SHOP_COLLECTION_NAME).document(
             str(shop_id)
         )
-        if not shop_document.get().exists:
+        if not get_cached_document(shop_document).exists:
             return flask.Response(
                 status=404, response=f"Shop with id {shop_id} not found"
             )
@@ -92,80 +187,252 @@ def shop_products(shop_id):
                 filter=FieldFilter("price", "<=", max_price)
             )
 
-        shop_products = shop_products.get()
-        shop_products_list = [product.to_dict() for product in shop_products]
-        return flask.jsonify(shop_products_list)
+        if wants_stream():
+            return stream_response(stream_query(shop_products))
+
+        # a poll with a current etag is answered from the update times alone,
+        # If-Modified-Since is not honoured on listings so it is not checked
+        if flask.request.if_none_match:
+            response = not_modified(
+                listing_etag(
+                    get_query_versions(
+                        shop_document.collection(PRODUCTS_COLLECTION_NAME),
+                        (min_price, max_price),
+                        shop_products,
+                    )
+                ),
+                check_modified_since=False,
+            )
+            if response is not None:
+                return response
+
+        if (min_price or max_price) and serves_price_range(
+            shop_document.collection(PRODUCTS_COLLECTION_NAME)
+        ):
+            shop_products = get_price_range(
+                shop_document.collection(PRODUCTS_COLLECTION_NAME),
+                min_price or None,
+                max_price or None,
+            )
+        elif min_price or max_price:
+            shop_products = get_cached_query(
+                shop_document.collection(PRODUCTS_COLLECTION_NAME),
+                (min_price, max_price),
+                shop_products,
+            )
+        else:
+            shop_products = get_query(shop_products)
+        return listing_response(shop_products)
     else:
         return flask.Response(status=405)
 
 
+@shop_blueprint.route("/<shop_id>/products/stats", methods=["GET"])
+def shop_products_stats(shop_id):
+    shop_document = firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id))
+    if not get_cached_document(shop_document).exists:
+        return flask.Response(status=404, response=f"Shop with id {shop_id} not found")
+    return price_stats_response(
+        shop_document.collection(PRODUCTS_COLLECTION_NAME), flask.request.args
+    )
+
+
+@shop_blueprint.route("/<shop_id>/products/batch", methods=["POST"])
+def shop_products_batch(shop_id):
+    shop_document = firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id))
+    if not get_document(shop_document).exists:
+        return flask.Response(status=404, response=f"Shop with id {shop_id} not found")
+
+    items = flask.request.json
+    if not isinstance(items, list):
+        return flask.Response(
+            status=400, response="Expected a list of products in the body"
+        )
+
+    # validate everything before reading or writing anything
+    errors = []
+    # the list keeps the order of the items, the set finds duplicates
+    product_ids = []
+    seen_ids = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or "product_id" not in item:
+            errors.append({"index": index, "error": "Missing required key: product_id"})
+        elif str(item["product_id"]) in seen_ids:
+            errors.append(
+                {"index": index, "error": f"Duplicate product id {item['product_id']}"}
+            )
+        else:
+            product_ids.append(str(item["product_id"]))
+            seen_ids.add(str(item["product_id"]))
+    if errors:
+        return flask.make_response(flask.jsonify(errors), 400)
+
+    products_collection = firestore_db.collection(PRODUCTS_COLLECTION_NAME)
+    shop_products_collection = shop_document.collection(PRODUCTS_COLLECTION_NAME)
+    product_snapshots = get_documents(
+        [products_collection.document(product_id) for product_id in product_ids]
+    )
+    product_in_shop_snapshots = get_documents(
+        [shop_products_collection.document(product_id) for product_id in product_ids]
+    )
+
+    results = []
+    writes = []
+    for item, product_id, product_snapshot, product_in_shop_snapshot in zip(
+        items, product_ids, product_snapshots, product_in_shop_snapshots
+    ):
+        if not product_snapshot.exists:
+            results.append(
+                {
+                    "id": product_id,
+                    "status": 404,
+                    "error": f"Product with id {product_id} not found",
+                }
+            )
+        elif product_in_shop_snapshot.exists:
+            results.append(
+                {
+                    "id": product_id,
+                    "status": 400,
+                    "error": f"Product with id {product_id} already exists in shop with id {shop_id}",
+                }
+            )
+        else:
+            product_data = product_snapshot.to_dict()
+            product_data.update(
+                {"quantity": item.get("quantity", 1), PRODUCT_ID_FIELD: product_id}
+            )
+            writes.append((product_in_shop_snapshot.reference, product_data))
+            results.append({"id": product_id, "status": 200})
+
+    set_documents(writes)
+    return flask.jsonify(results)
+
+
 @shop_blueprint.route(
     "/<shop_id>/products/<product_id>", methods=["GET", "POST", "PUT", "DELETE"]
 )
 def shop_product_id(shop_id, product_id):
     shop_document = firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id))
-    if not shop_document.get().exists:
+    product_document = firestore_db.collection(PRODUCTS_COLLECTION_NAME).document(
+        str(product_id)
+    )
+    product_in_shop_doc = shop_document.collection(PRODUCTS_COLLECTION_NAME).document(
+        str(product_id)
+    )
+
+    # the lookups below do not depend on each other, so fetch them together
+    if flask.request.method == "POST":
+        prefetch_documents([shop_document, product_document, product_in_shop_doc])
+    else:
+        prefetch_documents([shop_document, product_in_shop_doc])
+
+    if not get_document(shop_document).exists:
         return flask.Response(status=404, response=f"Shop with id {shop_id} not found")
 
     if flask.request.method == "GET":
-        product_in_shop_doc = shop_document.collection(
-            PRODUCTS_COLLECTION_NAME
-        ).document(str(product_id))
-        if not product_in_shop_doc.get().exists:
+        product_in_shop_snapshot = get_document(product_in_shop_doc)
+        if not product_in_shop_snapshot.exists:
             return flask.Response(status=404)
-        return flask.jsonify(product_in_shop_doc.get().to_dict())
+        return document_response(product_in_shop_snapshot)
 
     if flask.request.method == "POST":
-        product_document = firestore_db.collection(PRODUCTS_COLLECTION_NAME).document(
-            str(product_id)
-        )
-        if not product_document.get().exists:
+        product_snapshot = get_document(product_document)
+        if not product_snapshot.exists:
             return flask.Response(
                 status=404, response=f"Product with id {product_id} not found"
             )
 
-        product_in_shop_doc = shop_document.collection(
-            PRODUCTS_COLLECTION_NAME
-        ).document(str(product_id))
-
-        if product_in_shop_doc.get().exists:
+        if get_document(product_in_shop_doc).exists:
             return flask.Response(
                 status=400,
                 response=f"Product with id {product_id} already exists in shop with id {shop_id}",
             )
 
-        product_data = product_document.get().to_dict()
-        product_data.update({"quantity": flask.request.json.get("quantity", 1)})
+        product_data = product_snapshot.to_dict()
+        product_data.update(
+            {
+                "quantity": flask.request.json.get("quantity", 1),
+                PRODUCT_ID_FIELD: str(product_id),
+            }
+        )
 
-        firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id)).collection(
-            PRODUCTS_COLLECTION_NAME
-        ).document(str(product_id)).set(product_data)
+        set_document(product_in_shop_doc, product_data)
 
         return flask.jsonify({"id": product_id})
 
     if flask.request.method == "PUT":
-        product_in_shop_doc = (
-            firestore_db.collection(SHOP_COLLECTION_NAME)
-            .document(str(shop_id))
-            .collection(PRODUCTS_COLLECTION_NAME)
-            .document(str(product_id))
-        )
-
-        if not product_in_shop_doc.get().exists:
-            return flask.Response(status=404)
-
-        for key, value in flask.request.json.items():
-            product_in_shop_doc.get().reference.update({key: value})
+        try:
+            last_update_time = if_match_update_time(product_in_shop_doc)
+            if not update_document(
+                product_in_shop_doc, flask.request.json, last_update_time
+            ):
+                return flask.Response(status=404)
+        except FailedPrecondition:
+            if flask.request.if_match:
+                return flask.Response(
+                    status=412,
+                    response=f"Product with id {product_id} in shop with id {shop_id} does not match If-Match",
+                )
+            return flask.Response(
+                status=409,
+                response=f"Product with id {product_id} in shop with id {shop_id} was modified",
+            )
         return flask.jsonify({"id": product_id})
 
     if flask.request.method == "DELETE":
-        product_in_shop_doc = shop_document.collection(
-            PRODUCTS_COLLECTION_NAME
-        ).document(str(product_id))
-        if not product_in_shop_doc.get().exists:
-            return flask.Response(status=404)
-
-        product_in_shop_doc.get().reference.delete()
+        try:
+            last_update_time = if_match_update_time(product_in_shop_doc)
+            if (
+                last_update_time is None
+                and not get_document(product_in_shop_doc).exists
+            ):
+                return flask.Response(status=404)
+            delete_document(product_in_shop_doc, last_update_time)
+        except (FailedPrecondition, NotFound):
+            return flask.Response(
+                status=412,
+                response=f"Product with id {product_id} in shop with id {shop_id} does not match If-Match",
+            )
         return flask.Response(status=200)
 
     return flask.Response(status=405)
+
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# changes the stocked quantity by a delta instead of overwriting it, so
+# checkouts of the same product never have to read and retry, a floor in the
+# body refuses adjustments that would take the quantity below it
+@shop_blueprint.route("/<shop_id>/products/<product_id>/adjust", methods=["POST"])
+def shop_product_adjust(shop_id, product_id):
+    body = flask.request.json
+    if not isinstance(body, dict) or not _is_integer(body.get("delta")):
+        return flask.Response(
+            status=400, response="Expected an integer delta in the body"
+        )
+    floor = body.get("floor")
+    if floor is not None and not _is_integer(floor):
+        return flask.Response(status=400, response="Expected an integer floor")
+
+    shop_document = firestore_db.collection(SHOP_COLLECTION_NAME).document(str(shop_id))
+    if not get_cached_document(shop_document).exists:
+        return flask.Response(status=404, response=f"Shop with id {shop_id} not found")
+
+    product_in_shop_doc = shop_document.collection(PRODUCTS_COLLECTION_NAME).document(
+        str(product_id)
+    )
+    try:
+        quantity = increment_document(
+            product_in_shop_doc, "quantity", body["delta"], floor
+        )
+    except FailedPrecondition:
+        return flask.Response(
+            status=409,
+            response=f"Quantity of product with id {product_id} in shop with id {shop_id} cannot drop below {floor}",
+        )
+    if quantity is None:
+        return flask.Response(status=404)
+    return flask.jsonify({"id": product_id, "quantity": quantity})
@@ -0,0 +1,13 @@
+import flask
+from flask import Blueprint
+from .products import shop_copies_response
+
+shop_products_blueprint = Blueprint("shop_products", __name__)
+
+
+# every product stocked by any shop, filtered by price with one collection
+# group query instead of a query per shop
+@shop_products_blueprint.route("/", methods=["GET"])
+def shop_products():
+    product_id = flask.request.args.get("product_id", None)
+    return shop_copies_response(flask.request.args, product_id)
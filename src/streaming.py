@@ -0,0 +1,37 @@
+import flask
+from .msgpack_format import MSGPACK_MIMETYPE, packb, wants_msgpack
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def wants_stream():
+    if flask.request.args.get("stream", "").lower() in ("1", "true"):
+        return True
+    best = flask.request.accept_mimetypes.best_match(
+        ["application/json", NDJSON_MIMETYPE]
+    )
+    return best == NDJSON_MIMETYPE
+
+
+# one json document per line, written as soon as firestore yields the snapshot
+# so memory does not grow with the size of the collection, clients asking for
+# messagepack get a sequence of messagepack objects instead
+def stream_response(snapshots):
+    def generate():
+        for snapshot in snapshots:
+            yield flask.json.dumps(snapshot.to_dict()) + "\n"
+
+    def generate_msgpack():
+        for snapshot in snapshots:
+            yield packb(snapshot.to_dict())
+
+    if wants_msgpack():
+        response = flask.Response(
+            flask.stream_with_context(generate_msgpack()), mimetype=MSGPACK_MIMETYPE
+        )
+    else:
+        response = flask.Response(
+            flask.stream_with_context(generate()), mimetype=NDJSON_MIMETYPE
+        )
+    response.vary.add("Accept")
+    return response
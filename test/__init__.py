@@ -0,0 +1,5 @@
+import os
+
+# the tests run against the emulator unless FIRESTORE_BACKEND=memory is set
+if os.environ.get("FIRESTORE_BACKEND", "firestore").lower() != "memory":
+    os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8082")
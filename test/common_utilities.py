@@ -1,11 +1,26 @@
+import time
+from src.cache import document_cache, query_cache
 from src.firestore_db import firestore_db
+from src.price_index import price_indexes
 from src.products import PRODUCTS_COLLECTION_NAME
-from src.shop import SHOP_COLLECTION_NAME
+from src.shop import SHOP_COLLECTION_NAME, SHOP_DELETIONS_COLLECTION_NAME
 
 
 def delete_all_documents():
-    for collection_name in [SHOP_COLLECTION_NAME, PRODUCTS_COLLECTION_NAME]:
-        collection_ref = firestore_db.collection(collection_name)
-        docs = collection_ref.stream()
-        for doc in docs:
-            doc.reference.delete()
+    for collection_name in [
+        SHOP_COLLECTION_NAME,
+        SHOP_DELETIONS_COLLECTION_NAME,
+        PRODUCTS_COLLECTION_NAME,
+    ]:
+        firestore_db.recursive_delete(firestore_db.collection(collection_name))
+    document_cache.clear()
+    query_cache.clear()
+    price_indexes.clear()
+
+
+# listeners of the emulator deliver changes on a background thread
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
@@ -0,0 +1,125 @@
+import time
+import unittest
+from src.cache import DocumentCache, QueryCache
+
+
+class TestDocumentCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = DocumentCache(maxsize=2, ttl=60)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_get_counts_hits_and_misses(self):
+        self.assertIsNone(self.cache.get("products/a"))
+        self.cache.put("products/a", "snapshot", 0)
+        self.assertEqual(self.cache.get("products/a"), "snapshot")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_put_evicts_least_recently_used(self):
+        self.cache.put("products/a", "a", 0)
+        self.cache.put("products/b", "b", 0)
+        self.cache.get("products/a")
+        self.cache.put("products/c", "c", 0)
+        self.assertIsNone(self.cache.get("products/b"))
+        self.assertEqual(self.cache.get("products/a"), "a")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = DocumentCache(maxsize=2, ttl=0.01)
+        cache.put("products/a", "a", 0)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("products/a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_invalidate(self):
+        self.cache.put("products/a", "a", 0)
+        self.cache.invalidate("products/a")
+        self.assertIsNone(self.cache.get("products/a"))
+
+    def test_refresh_replaces_cached_entries_only(self):
+        self.cache.put("products/a", "a", 0)
+        self.cache.refresh("products/a", "new a")
+        self.cache.refresh("products/b", "new b")
+        self.assertEqual(self.cache.get("products/a"), "new a")
+        self.assertIsNone(self.cache.get("products/b"))
+
+    def test_put_after_invalidate_is_dropped(self):
+        version = self.cache.version()
+        self.cache.invalidate("products/a")
+        self.cache.put("products/a", "old a", version)
+        self.assertIsNone(self.cache.get("products/a"))
+
+        with self.subTest("a put that started after it is stored"):
+            self.cache.put("products/a", "a", self.cache.version())
+            self.assertEqual(self.cache.get("products/a"), "a")
+
+    def test_put_after_refresh_is_dropped(self):
+        version = self.cache.version()
+        self.cache.refresh("products/a", "new a")
+        self.cache.put("products/a", "old a", version)
+        self.assertIsNone(self.cache.get("products/a"))
+
+    def test_put_does_not_overwrite_a_refresh(self):
+        self.cache.put("products/a", "a", 0)
+        version = self.cache.version()
+        self.cache.refresh("products/a", "new a")
+        self.cache.put("products/a", "old a", version)
+        self.assertEqual(self.cache.get("products/a"), "new a")
+
+    def test_put_after_forgotten_invalidation_is_dropped(self):
+        version = self.cache.version()
+        for path in ["products/a", "products/b", "products/c"]:
+            self.cache.invalidate(path)
+        self.cache.put("products/a", "old a", version)
+        self.assertIsNone(self.cache.get("products/a"))
+
+    def test_put_of_another_path_is_stored(self):
+        version = self.cache.version()
+        self.cache.invalidate("products/b")
+        self.cache.put("products/a", "a", version)
+        self.assertEqual(self.cache.get("products/a"), "a")
+
+    def test_zero_ttl_disables_cache(self):
+        cache = DocumentCache(maxsize=2, ttl=0)
+        cache.put("products/a", "a", 0)
+        self.assertIsNone(cache.get("products/a"))
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = QueryCache(maxsize=4, ttl=60)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_get_by_collection_and_key(self):
+        self.cache.put("products", (10.0, None), ["a"], 0)
+        self.assertEqual(self.cache.get("products", (10.0, None)), (["a"], 0))
+        self.assertEqual(self.cache.get("products", (None, 10.0)), (None, 0))
+        self.assertEqual(self.cache.get("shops/a/products", (10.0, None)), (None, 0))
+
+    def test_invalidate_drops_every_result_for_the_collection(self):
+        self.cache.put("products", (10.0, None), ["a"], 0)
+        self.cache.put("products", (None, 10.0), ["b"], 0)
+        self.cache.put("shops/a/products", (10.0, None), ["c"], 0)
+        self.cache.invalidate("products")
+        self.assertEqual(self.cache.get("products", (10.0, None)), (None, 1))
+        self.assertEqual(self.cache.get("products", (None, 10.0)), (None, 1))
+        self.assertEqual(self.cache.get("shops/a/products", (10.0, None)), (["c"], 0))
+
+    def test_put_after_invalidate_is_dropped(self):
+        _, generation = self.cache.get("products", (10.0, None))
+        self.cache.invalidate("products")
+        self.cache.put("products", (10.0, None), ["old"], generation)
+        snapshots, generation = self.cache.get("products", (10.0, None))
+        self.assertIsNone(snapshots)
+
+        with self.subTest("a put of the new generation is stored"):
+            self.cache.put("products", (10.0, None), ["new"], generation)
+            self.assertEqual(
+                self.cache.get("products", (10.0, None)), (["new"], generation)
+            )
@@ -0,0 +1,61 @@
+import unittest
+from src import cache_listener
+from src.app import app
+from src.documents import rpc_count
+from src.firestore_db import firestore_db
+from test.common_utilities import delete_all_documents, wait_for
+
+
+class TestCacheListenerWithWritesOfOtherWorkers(unittest.TestCase):
+    # writes made straight through firestore_db stand in for other workers
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        self.product_id = self.app.post(
+            "/products/",
+            json={"name": "product", "description": "product", "price": 5},
+        ).json["id"]
+        self.shop_id = self.app.post(
+            "/shop/", json={"name": "shop", "address": "address"}
+        ).json["id"]
+        cache_listener.start()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        cache_listener.stop()
+        delete_all_documents()
+        return super().tearDown()
+
+    def assert_cached(self, url):
+        self.app.get(url)
+        with self.app:
+            self.assertEqual(self.app.get(url).status_code, 200)
+            self.assertEqual(rpc_count(), 0)
+
+    def test_product_is_refreshed(self):
+        url = f"/products/{self.product_id}"
+        self.assert_cached(url)
+        firestore_db.collection("products").document(self.product_id).update(
+            {"price": 9}
+        )
+        self.assertTrue(wait_for(lambda: self.app.get(url).json["price"] == 9))
+
+    def test_removed_product_is_evicted(self):
+        url = f"/products/{self.product_id}"
+        self.assert_cached(url)
+        firestore_db.collection("products").document(self.product_id).delete()
+        self.assertTrue(wait_for(lambda: self.app.get(url).status_code == 404))
+
+    def test_shop_is_refreshed(self):
+        url = f"/shop/{self.shop_id}"
+        self.assert_cached(url)
+        firestore_db.collection("shops").document(self.shop_id).update(
+            {"name": "renamed"}
+        )
+        self.assertTrue(wait_for(lambda: self.app.get(url).json["name"] == "renamed"))
+
+    def test_removed_shop_is_evicted(self):
+        url = f"/shop/{self.shop_id}"
+        self.assert_cached(url)
+        firestore_db.collection("shops").document(self.shop_id).delete()
+        self.assertTrue(wait_for(lambda: self.app.get(url).status_code == 404))
@@ -0,0 +1,126 @@
+import gzip
+import json
+import random
+import unittest
+import zlib
+import flask
+from src import compression
+from src.app import app
+from test.common_utilities import delete_all_documents
+
+
+def random_text(length):
+    return "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=length))
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        self.app.post(
+            "/products/batch",
+            json=[
+                {
+                    "name": random_text(10),
+                    "description": random_text(100),
+                    "price": random.randint(1, 100),
+                }
+                for _ in range(20)
+            ],
+        )
+        self.product_id = self.app.post(
+            "/products/",
+            json={"name": "big", "description": random_text(1000), "price": 1},
+        ).json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_listing_is_gzipped(self):
+        plain = self.app.get("/products/")
+        response = self.app.get("/products/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertEqual(json.loads(gzip.decompress(response.data)), plain.json)
+
+    def test_not_compressed_without_accept_encoding(self):
+        response = self.app.get("/products/")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        response = self.app.get(
+            "/products/", headers={"Accept-Encoding": "gzip;q=0, identity"}
+        )
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.app.get("/products/stats", headers={"Accept-Encoding": "gzip"})
+        self.assertLess(len(response.data), compression.COMPRESSION_MIN_SIZE)
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_streamed_listing_is_gzipped(self):
+        plain = self.app.get("/products/?stream=1")
+        response = self.app.get(
+            "/products/?stream=1", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+    def test_streamed_chunks_are_sent_as_they_are_produced(self):
+        produced = []
+
+        def body():
+            for index in range(50):
+                produced.append(index)
+                yield json.dumps({"index": index}) + "\n"
+
+        with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+            response = compression.compress_response(
+                flask.Response(body(), mimetype="application/x-ndjson")
+            )
+        chunks = iter(response.response)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(next(chunks)), b'{"index": 0}\n')
+        self.assertEqual(produced, [0])
+        data = b"".join(decompressor.decompress(chunk) for chunk in chunks)
+        self.assertEqual(len(data.splitlines()), 49)
+
+    def test_compressed_variant_has_its_own_etag(self):
+        url = f"/products/{self.product_id}"
+        etag = self.app.get(url).headers["ETag"]
+        response = self.app.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        compressed_etag = response.headers["ETag"]
+        self.assertEqual(compressed_etag, f'{etag[:-1]}-gzip"')
+
+        response = self.app.get(
+            url,
+            headers={"Accept-Encoding": "gzip", "If-None-Match": compressed_etag},
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], compressed_etag)
+        response = self.app.get(url, headers={"If-None-Match": compressed_etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_if_match_accepts_compressed_variant_etag(self):
+        url = f"/products/{self.product_id}"
+        etag = self.app.get(url, headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+        response = self.app.put(url, json={"price": 2}, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        response = self.app.put(url, json={"price": 3}, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, 412)
+
+    @unittest.skipIf(compression.brotli is None, "brotli is not installed")
+    def test_listing_prefers_brotli(self):
+        plain = self.app.get("/products/")
+        response = self.app.get(
+            "/products/", headers={"Accept-Encoding": "gzip, deflate, br"}
+        )
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(
+            json.loads(compression.brotli.decompress(response.data)), plain.json
+        )
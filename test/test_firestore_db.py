@@ -0,0 +1,121 @@
+import datetime
+import os
+import threading
+import unittest
+from concurrent import futures
+from unittest import mock
+import flask
+import grpc
+from google.cloud.firestore_v1 import types
+from src import async_firestore_db
+from src.app import app
+from src.firestore_db import (
+    CHANNEL_OPTIONS,
+    FirestoreClientPool,
+    TunedAsyncClient,
+    firestore_db,
+)
+
+
+class TestFirestoreClientPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = FirestoreClientPool(size=2, factory=object)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_thread_keeps_its_client(self):
+        self.assertIs(self.pool.client(), self.pool.client())
+
+    def test_threads_are_spread_over_clients(self):
+        clients = []
+        threads = [
+            threading.Thread(target=lambda: clients.append(self.pool.client()))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(map(id, clients))), 2)
+
+    def test_clients_are_created_again_after_fork(self):
+        client = self.pool.client()
+        with mock.patch("os.getpid", return_value=-1):
+            self.assertIsNot(self.pool.client(), client)
+
+    def test_delegates_to_client(self):
+        self.assertEqual(
+            firestore_db.collection("products").document("a").path, "products/a"
+        )
+
+    def test_channel_options(self):
+        self.assertIn(("grpc.use_local_subchannel_pool", 1), CHANNEL_OPTIONS)
+
+
+# answers every document lookup with a missing document, once as many lookups
+# as the test expects are in flight together
+def _batch_get_documents(request, context):
+    _lookups.wait()
+    for document in request.documents:
+        yield types.BatchGetDocumentsResponse(
+            missing=document, read_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+
+
+_lookups = threading.Barrier(1)
+
+
+class TestTunedAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        self.server.add_generic_rpc_handlers(
+            [
+                grpc.method_handlers_generic_handler(
+                    "google.firestore.v1.Firestore",
+                    {
+                        "BatchGetDocuments": grpc.unary_stream_rpc_method_handler(
+                            _batch_get_documents,
+                            request_deserializer=types.BatchGetDocumentsRequest.deserialize,
+                            response_serializer=types.BatchGetDocumentsResponse.serialize,
+                        )
+                    },
+                )
+            ]
+        )
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        self.server.start()
+        with mock.patch.dict(
+            os.environ, {"FIRESTORE_EMULATOR_HOST": f"127.0.0.1:{port}"}
+        ):
+            self.client = TunedAsyncClient(project="test-project")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        global _lookups
+        _lookups = threading.Barrier(1)
+        self.server.stop(None)
+        return super().tearDown()
+
+    def test_async_rpcs_are_counted_for_the_request(self):
+        with app.app_context():
+            snapshot = async_firestore_db.run(self.client.document("products/a").get())
+            self.assertFalse(snapshot.exists)
+            self.assertEqual(flask.g.firestore_calls.count, 1)
+
+    def test_lookups_are_gathered(self):
+        global _lookups
+        # the lookups only return once all three are in flight
+        _lookups = threading.Barrier(3, timeout=5)
+        references = [
+            firestore_db.collection("products").document(doc_id)
+            for doc_id in ["a", "b", "c"]
+        ]
+        with app.app_context(), mock.patch.object(
+            async_firestore_db, "FIRESTORE_BACKEND", "firestore"
+        ), mock.patch.object(async_firestore_db, "_get_client", lambda: self.client):
+            snapshots = async_firestore_db.get_documents(references)
+            self.assertEqual(flask.g.firestore_calls.count, 3)
+        self.assertEqual([snapshot.id for snapshot in snapshots], ["a", "b", "c"])
+        self.assertFalse(any(snapshot.exists for snapshot in snapshots))
@@ -0,0 +1,12 @@
+import json
+import os
+import unittest
+from src.firestore_indexes import manifest
+
+INDEXES_PATH = os.path.join(os.path.dirname(__file__), "..", "firestore.indexes.json")
+
+
+class TestFirestoreIndexes(unittest.TestCase):
+    def test_committed_indexes_match_manifest(self):
+        with open(INDEXES_PATH) as indexes:
+            self.assertEqual(json.load(indexes), manifest())
@@ -0,0 +1,75 @@
+import datetime
+import unittest
+from unittest import mock
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import GeoPoint
+from src import json_provider
+from src.app import app
+from src.firestore_db import firestore_db
+from test.common_utilities import delete_all_documents
+
+
+class TestFirestoreJSONProvider(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        self.document = {
+            "name": "é",
+            "price": 2.5,
+            "quantity": 3,
+            "tags": ["a", None, True],
+            "updated_at": DatetimeWithNanoseconds(
+                2024, 1, 2, 3, 4, 5, nanosecond=123456789, tzinfo=datetime.timezone.utc
+            ),
+            "shop": firestore_db.collection("shops").document("s1"),
+            "location": GeoPoint(51.5, -0.1),
+        }
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_encodes_firestore_values(self):
+        self.assertEqual(
+            app.json.loads(app.json.dumps(self.document)),
+            {
+                "name": "é",
+                "price": 2.5,
+                "quantity": 3,
+                "tags": ["a", None, True],
+                "updated_at": "2024-01-02T03:04:05.123456789Z",
+                "shop": "shops/s1",
+                "location": {"latitude": 51.5, "longitude": -0.1},
+            },
+        )
+
+    def test_output_is_compact(self):
+        self.assertNotIn(" ", app.json.dumps({"a": [1, 2], "b": {"c": "d"}}))
+        with app.app_context():
+            response = app.json.response({"a": 1})
+        self.assertEqual(response.data, b'{"a":1}\n')
+
+    def test_standard_library_fallback_matches(self):
+        encoded = app.json.dumps(self.document)
+        with mock.patch.object(json_provider, "orjson", None):
+            self.assertEqual(app.json.dumps(self.document), encoded)
+
+    def test_unknown_types_are_rejected(self):
+        with self.assertRaises(TypeError):
+            app.json.dumps({"value": object()})
+
+    def test_timestamps_of_documents_are_returned(self):
+        shop_id = self.app.post("/shop/", json={"name": "shop", "address": "a"}).json[
+            "id"
+        ]
+        firestore_db.collection("shop_deletions").document(shop_id).set(
+            {
+                "status": "running",
+                "started_at": datetime.datetime(
+                    2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc
+                ),
+            }
+        )
+        response = self.app.get(f"/shop/{shop_id}/deletion")
+        self.assertEqual(response.json["started_at"], "2024-01-02T03:04:05.123456Z")
@@ -0,0 +1,171 @@
+import unittest
+from google.api_core import exceptions
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from src.memory_db import MemoryClient, MemoryFirestore
+
+
+class TestMemoryClient(unittest.TestCase):
+    def setUp(self):
+        self.rpcs = []
+        self.db = MemoryClient(MemoryFirestore([self.rpcs.append]))
+        self.products = self.db.collection("products")
+        for index in range(5):
+            self.products.document(f"p{index}").set(
+                {"name": f"product {index}", "price": index * 10, "tags": [str(index)]}
+            )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_set_and_get(self):
+        snapshot = self.products.document("p1").get()
+        self.assertTrue(snapshot.exists)
+        self.assertEqual(snapshot.to_dict()["price"], 10)
+        self.assertFalse(self.products.document("missing").get().exists)
+
+    def test_add_generates_an_id(self):
+        _, reference = self.products.add({"name": "added"})
+        self.assertEqual(len(reference.id), 20)
+        self.assertEqual(reference.get().get("name"), "added")
+
+    def test_where_filters_and_orders(self):
+        query = (
+            self.products.where(filter=FieldFilter("price", ">=", 20))
+            .where(filter=FieldFilter("price", "<", 40))
+            .order_by("price", direction=firestore.Query.DESCENDING)
+        )
+        self.assertEqual([snapshot.id for snapshot in query.stream()], ["p3", "p2"])
+
+    def test_where_array_contains_and_in(self):
+        query = self.products.where(filter=FieldFilter("tags", "array_contains", "3"))
+        self.assertEqual([snapshot.id for snapshot in query.stream()], ["p3"])
+        query = self.products.where(filter=FieldFilter("price", "in", [0, 40]))
+        self.assertEqual([snapshot.id for snapshot in query.stream()], ["p0", "p4"])
+
+    def test_cursor_limit_and_select(self):
+        query = (
+            self.products.order_by("price")
+            .start_after({"price": 10})
+            .limit(2)
+            .select(["price"])
+        )
+        self.assertEqual(
+            [snapshot.to_dict() for snapshot in query.stream()],
+            [{"price": 20}, {"price": 30}],
+        )
+
+    def test_update_applies_transforms(self):
+        self.products.document("p1").update(
+            {
+                "price": firestore.Increment(5),
+                "tags": firestore.ArrayUnion(["sale"]),
+                "name": firestore.DELETE_FIELD,
+            }
+        )
+        self.assertEqual(
+            self.products.document("p1").get().to_dict(),
+            {"price": 15, "tags": ["1", "sale"]},
+        )
+
+    def test_update_checks_preconditions(self):
+        snapshot = self.products.document("p1").get()
+        self.products.document("p1").update({"price": 11})
+        with self.assertRaises(exceptions.FailedPrecondition):
+            self.products.document("p1").update(
+                {"price": 12},
+                option=self.db.write_option(last_update_time=snapshot.update_time),
+            )
+        with self.assertRaises(exceptions.NotFound):
+            self.products.document("missing").update({"price": 1})
+
+    def test_batch_is_atomic(self):
+        batch = self.db.batch()
+        batch.set(self.products.document("p5"), {"price": 50})
+        batch.update(self.products.document("missing"), {"price": 1})
+        with self.assertRaises(exceptions.NotFound):
+            batch.commit()
+        self.assertFalse(self.products.document("p5").get().exists)
+
+    def test_get_all_returns_missing_documents(self):
+        snapshots = self.db.get_all(
+            [self.products.document("p1"), self.products.document("missing")]
+        )
+        self.assertEqual(
+            {snapshot.id: snapshot.exists for snapshot in snapshots},
+            {"p1": True, "missing": False},
+        )
+
+    def test_transaction(self):
+        @firestore.transactional
+        def restock(transaction, reference):
+            snapshot = reference.get(transaction=transaction)
+            transaction.update(reference, {"price": snapshot.get("price") + 1})
+
+        restock(self.db.transaction(), self.products.document("p1"))
+        self.assertEqual(self.products.document("p1").get().get("price"), 11)
+
+    def test_subcollections_and_collection_group(self):
+        shop = self.db.collection("shops").document("s1")
+        shop.set({"name": "shop"})
+        shop.collection("products").document("p1").set({"quantity": 1})
+        self.assertEqual(
+            [collection.id for collection in shop.collections()], ["products"]
+        )
+        query = self.db.collection_group("products").where(
+            filter=FieldFilter("quantity", "==", 1)
+        )
+        self.assertEqual(
+            [snapshot.reference.path for snapshot in query.stream()],
+            ["shops/s1/products/p1"],
+        )
+
+    def test_recursive_delete(self):
+        shop = self.db.collection("shops").document("s1")
+        shop.set({"name": "shop"})
+        shop.collection("products").document("p1").set({"quantity": 1})
+        self.assertEqual(self.db.recursive_delete(shop), 2)
+        self.assertEqual(
+            list(self.db.collection_group("products").stream())[0].id, "p0"
+        )
+        self.assertEqual(self.db.recursive_delete(self.products), 5)
+        self.assertEqual(list(self.products.stream()), [])
+
+    def test_on_snapshot(self):
+        changes = []
+        watch = self.products.on_snapshot(
+            lambda snapshots, document_changes, read_time: changes.extend(
+                (change.type.name, change.document.id) for change in document_changes
+            )
+        )
+        self.products.document("p1").delete()
+        watch.unsubscribe()
+        self.products.document("p2").delete()
+        self.assertEqual(changes[-1], ("REMOVED", "p1"))
+        self.assertEqual(len(changes), 6)
+
+    def test_on_snapshot_documents_carry_update_times(self):
+        documents = []
+        watch = self.products.on_snapshot(
+            lambda snapshots, document_changes, read_time: documents.extend(
+                change.document for change in document_changes
+            )
+        )
+        self.products.document("p1").update({"price": 9})
+        watch.unsubscribe()
+        self.assertEqual(
+            documents[-1].update_time, self.products.document("p1").get().update_time
+        )
+
+    def test_rpcs_are_reported(self):
+        self.rpcs.clear()
+        self.products.document("p1").get()
+        list(self.products.stream())
+        self.assertEqual(
+            self.rpcs,
+            [
+                "/google.firestore.v1.Firestore/BatchGetDocuments",
+                "/google.firestore.v1.Firestore/RunQuery",
+            ],
+        )
@@ -0,0 +1,41 @@
+import unittest
+from src.app import app
+from src.metrics import Histogram
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_metrics(self):
+        self.app.get("/healthz")
+        response = self.app.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/plain")
+        self.assertIn(
+            'http_requests_total{method="GET",route="/healthz/",status="200"}',
+            response.data.decode(),
+        )
+
+    def test_metrics_counts_firestore_rpcs(self):
+        self.app.get("/products/invalid-id")
+        metrics = self.app.get("/metrics").data.decode()
+        self.assertIn(
+            'firestore_request_rpcs_count{method="GET",route="/products/<product_id>"}',
+            metrics,
+        )
+        self.assertIn("firestore_rpcs_total{", metrics)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative(self):
+        histogram = Histogram((1, 2))
+        for value in [0.5, 1, 1.5, 3]:
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(1, 2), (2, 3), ("+Inf", 4)])
+        self.assertEqual(histogram.sum, 6)
+        self.assertEqual(histogram.count, 4)
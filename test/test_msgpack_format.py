@@ -0,0 +1,159 @@
+import json
+import unittest
+import msgpack
+from src.app import app
+from src.msgpack_format import MSGPACK_MIMETYPE
+from test.common_utilities import delete_all_documents
+
+MSGPACK_HEADERS = {"Accept": MSGPACK_MIMETYPE}
+
+
+class TestMsgpackFormat(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        self.shop_id = self.app.post(
+            "/shop/", json={"name": "shop", "address": "address"}
+        ).json["id"]
+        self.product_ids = [
+            self.app.post(
+                "/products/",
+                json={"name": str(price), "description": "é product", "price": price},
+            ).json["id"]
+            for price in [10, 20.5, 30]
+        ]
+        for product_id in self.product_ids:
+            self.app.post(
+                f"/shop/{self.shop_id}/products/{product_id}", json={"quantity": 2}
+            )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def post_msgpack(self, url, body):
+        return self.app.post(
+            url, data=msgpack.packb(body), content_type=MSGPACK_MIMETYPE
+        )
+
+    def test_read_endpoints_match_json(self):
+        product_id = self.product_ids[1]
+        for url in [
+            "/products/",
+            "/products/?min_price=15&limit=1",
+            f"/products/{product_id}",
+            f"/products/?ids={','.join(self.product_ids)}",
+            "/products/stats",
+            f"/products/{product_id}/shops",
+            f"/shop/{self.shop_id}",
+            f"/shop/{self.shop_id}/products",
+            f"/shop/{self.shop_id}/products/{product_id}",
+            f"/shop/{self.shop_id}/products/stats?max_price=25",
+            "/shop-products/?max_price=25",
+        ]:
+            with self.subTest(url=url):
+                expected = self.app.get(url)
+                response = self.app.get(url, headers=MSGPACK_HEADERS)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, MSGPACK_MIMETYPE)
+                self.assertIn("Accept", response.headers["Vary"])
+                self.assertEqual(msgpack.unpackb(response.data), expected.json)
+
+    def test_msgpack_is_smaller_than_json(self):
+        expected = self.app.get("/products/")
+        response = self.app.get("/products/", headers=MSGPACK_HEADERS)
+        self.assertLess(len(response.data), len(expected.data))
+
+    def test_json_is_preferred_when_both_are_accepted(self):
+        response = self.app.get(
+            "/products/", headers={"Accept": f"application/json, {MSGPACK_MIMETYPE}"}
+        )
+        self.assertEqual(response.mimetype, "application/json")
+        response = self.app.get(
+            "/products/",
+            headers={"Accept": f"application/json;q=0.5, {MSGPACK_MIMETYPE}"},
+        )
+        self.assertEqual(response.mimetype, MSGPACK_MIMETYPE)
+
+    def test_streamed_listing_is_a_msgpack_sequence(self):
+        expected = self.app.get("/products/?stream=1")
+        response = self.app.get("/products/?stream=1", headers=MSGPACK_HEADERS)
+        self.assertEqual(response.mimetype, MSGPACK_MIMETYPE)
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(response.data)
+        self.assertEqual(
+            list(unpacker), [json.loads(line) for line in expected.data.splitlines()]
+        )
+
+    def test_post_and_put_accept_msgpack_bodies(self):
+        response = self.post_msgpack(
+            "/products/", {"name": "packed", "description": "d", "price": 1.5}
+        )
+        self.assertEqual(response.status_code, 200)
+        product_id = response.json["id"]
+        response = self.app.put(
+            f"/products/{product_id}",
+            data=msgpack.packb({"price": 2.5}),
+            content_type=MSGPACK_MIMETYPE,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.app.get(f"/products/{product_id}").json,
+            {"name": "packed", "description": "d", "price": 2.5},
+        )
+        response = self.post_msgpack(
+            f"/shop/{self.shop_id}/products/{product_id}", {"quantity": 3}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.post_msgpack(
+            "/products/batch", [{"name": "a", "description": "b", "price": 1}]
+        )
+        self.assertEqual(len(response.json), 1)
+
+    def test_invalid_msgpack_body(self):
+        response = self.app.post(
+            "/products/", data=b"\xc1", content_type=MSGPACK_MIMETYPE
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.post_msgpack("/products/", {"name": "missing keys"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_msgpack_variant_has_its_own_etag(self):
+        url = f"/products/{self.product_ids[0]}"
+        etag = self.app.get(url).headers["ETag"]
+        response = self.app.get(url, headers=MSGPACK_HEADERS)
+        msgpack_etag = response.headers["ETag"]
+        self.assertEqual(msgpack_etag, f'{etag[:-1]}-msgpack"')
+        response = self.app.get(
+            url, headers={**MSGPACK_HEADERS, "If-None-Match": msgpack_etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], msgpack_etag)
+        response = self.app.put(
+            url, json={"price": 11}, headers={"If-Match": msgpack_etag}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_json_etag_does_not_match_msgpack(self):
+        url = f"/products/{self.product_ids[0]}"
+        json_etag = self.app.get(url).headers["ETag"]
+        msgpack_etag = self.app.get(url, headers=MSGPACK_HEADERS).headers["ETag"]
+        response = self.app.get(
+            url, headers={**MSGPACK_HEADERS, "If-None-Match": json_etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, MSGPACK_MIMETYPE)
+        response = self.app.get(url, headers={"If-None-Match": msgpack_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/json")
+
+    def test_not_modified_varies_on_accept(self):
+        url = f"/shop/{self.shop_id}/products"
+        etag = self.app.get(url).headers["ETag"]
+        response = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("Accept", response.headers["Vary"])
+        response = self.app.get(url, headers={**MSGPACK_HEADERS, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(msgpack.unpackb(response.data), self.app.get(url).json)
@@ -0,0 +1,203 @@
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from src import cache_listener
+from src.app import app
+from src.firestore_db import firestore_db
+from src.price_index import PriceIndex, PriceIndexes, in_price_range, price_indexes
+from test.common_utilities import delete_all_documents, wait_for
+
+
+def snapshots(*prices):
+    return [
+        SimpleNamespace(
+            id=doc_id, exists=True, to_dict=lambda price=price: {"price": price}
+        )
+        for doc_id, price in prices
+    ]
+
+
+# the documents of a load that only finishes once loading is set
+def blocked(loading, *prices):
+    loading.wait(5)
+    return snapshots(*prices)
+
+
+class TestPriceIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PriceIndex([("a", 10), ("b", 20), ("c", 25), ("d", 30)])
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_range(self):
+        self.assertEqual(self.index.range(20), ["b", "c", "d"])
+        self.assertEqual(self.index.range(max_price=20), ["a", "b"])
+        self.assertEqual(self.index.range(20, 25), ["b", "c"])
+        self.assertEqual(self.index.range(), ["a", "b", "c", "d"])
+        self.assertEqual(self.index.range(40), [])
+
+    def test_skips_documents_without_a_numeric_price(self):
+        index = PriceIndex([("a", 10), ("b", None), ("c", "20"), ("d", True)])
+        self.assertEqual(len(index), 1)
+
+    def test_upsert_moves_existing_document(self):
+        self.index.upsert("a", 27)
+        self.assertEqual(self.index.range(), ["b", "c", "a", "d"])
+        self.assertEqual(len(self.index), 4)
+
+    def test_upsert_without_price_removes_document(self):
+        self.index.upsert("b", None)
+        self.assertEqual(self.index.range(), ["a", "c", "d"])
+
+    def test_remove(self):
+        self.index.remove("c")
+        self.index.remove("missing")
+        self.assertEqual(self.index.range(20), ["b", "d"])
+
+    def test_equal_prices(self):
+        self.index.upsert("e", 20)
+        self.index.remove("b")
+        self.assertEqual(self.index.range(20, 20), ["e"])
+
+    def test_in_price_range(self):
+        self.assertTrue(in_price_range(20, 20, 25))
+        self.assertFalse(in_price_range(30, 20, 25))
+        self.assertFalse(in_price_range(None, 20))
+
+    def test_index_is_loaded_in_the_background(self):
+        indexes = PriceIndexes(enabled=True)
+        indexes.load_when_stale("products", lambda: snapshots(("a", 10)))
+        self.assertTrue(wait_for(lambda: indexes.get("products") is not None))
+        self.assertEqual(indexes.get("products").range(), ["a"])
+
+    def test_expired_index_is_served_while_it_is_reloaded(self):
+        indexes = PriceIndexes(enabled=True, ttl=0)
+        indexes.load_when_stale("products", lambda: snapshots(("a", 10)))
+        self.assertTrue(wait_for(lambda: indexes.get("products") is not None))
+        loading = threading.Event()
+        indexes.load_when_stale("products", lambda: blocked(loading, ("b", 20)))
+        self.assertEqual(indexes.get("products").range(), ["a"])
+        loading.set()
+        self.assertTrue(wait_for(lambda: indexes.get("products").range() == ["b"]))
+
+    def test_collection_is_loaded_once_at_a_time(self):
+        indexes = PriceIndexes(enabled=True)
+        loading = threading.Event()
+        loads = []
+
+        def load():
+            loads.append(True)
+            return blocked(loading, ("a", 10))
+
+        for _ in range(3):
+            indexes.load_when_stale("products", load)
+        loading.set()
+        self.assertTrue(wait_for(lambda: indexes.get("products") is not None))
+        self.assertEqual(len(loads), 1)
+
+    def test_writes_during_a_load_are_replayed(self):
+        indexes = PriceIndexes(enabled=True)
+        loading = threading.Event()
+        indexes.load_when_stale(
+            "products", lambda: blocked(loading, ("a", 10), ("b", 20))
+        )
+        indexes.record_write("products", "c", {"price": 15})
+        indexes.record_write("products", "a", {"price": 30})
+        indexes.record_delete("products", "b")
+        loading.set()
+        self.assertTrue(wait_for(lambda: indexes.get("products") is not None))
+        self.assertEqual(indexes.get("products").range(), ["c", "a"])
+
+    def test_index_dropped_during_its_load_is_not_kept(self):
+        indexes = PriceIndexes(enabled=True)
+        loading = threading.Event()
+        indexes.load_when_stale("products", lambda: blocked(loading, ("a", 10)))
+        indexes.drop("products")
+        loading.set()
+        indexes.load_when_stale("products", lambda: snapshots(("b", 20)))
+        self.assertTrue(wait_for(lambda: indexes.get("products") is not None))
+        self.assertEqual(indexes.get("products").range(), ["b"])
+
+    def test_index_is_not_served_without_a_listener(self):
+        indexes = PriceIndexes(enabled=True)
+        self.assertFalse(indexes.covers("products"))
+        indexes.watched("products")
+        self.assertTrue(indexes.covers("products"))
+        indexes.enabled = False
+        self.assertFalse(indexes.covers("products"))
+
+
+class TestPriceIndexWithWritesOfOtherWorkers(unittest.TestCase):
+    # writes made straight through firestore_db stand in for other workers
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        self.enabled = price_indexes.enabled
+        price_indexes.enabled = True
+        for price in [10, 20]:
+            self.app.post(
+                "/products/",
+                json={"name": str(price), "description": "product", "price": price},
+            )
+        self.shop_id = self.app.post(
+            "/shop/", json={"name": "shop", "address": "address"}
+        ).json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        cache_listener.stop()
+        price_indexes.enabled = self.enabled
+        delete_all_documents()
+        return super().tearDown()
+
+    def prices(self, url):
+        return sorted(product["price"] for product in self.app.get(url).json)
+
+    @unittest.skipIf(cache_listener.LISTENER_ENABLED, "the listener is enabled")
+    def test_products_without_listener_are_queried(self):
+        firestore_db.collection("products").document("other").set(
+            {"name": "other", "description": "product", "price": 25}
+        )
+        self.assertEqual(self.prices("/products/?min_price=15"), [20, 25])
+        self.assertIsNone(price_indexes.get("products"))
+
+    def test_products_with_listener_are_served_from_index(self):
+        cache_listener.start()
+        # loaded as the listener starts, until then the range is queried
+        self.assertEqual(self.prices("/products/?min_price=15"), [20])
+        self.assertTrue(wait_for(lambda: price_indexes.get("products") is not None))
+        firestore_db.collection("products").document("other").set(
+            {"name": "other", "description": "product", "price": 25}
+        )
+        self.assertTrue(
+            wait_for(lambda: self.prices("/products/?min_price=15") == [20, 25])
+        )
+
+    def test_shop_products_with_listener_are_served_from_index(self):
+        url = f"/shop/{self.shop_id}/products?min_price=15"
+        path = f"shops/{self.shop_id}/products"
+        cache_listener.start()
+        self.assertEqual(self.prices(url), [])
+        self.assertTrue(price_indexes.is_watched(path))
+        self.assertTrue(wait_for(lambda: price_indexes.get(path) is not None))
+        firestore_db.collection(path).document("other").set(
+            {"name": "other", "description": "product", "price": 25, "quantity": 1}
+        )
+        self.assertTrue(wait_for(lambda: self.prices(url) == [25]))
+
+    def test_least_recently_used_shop_loses_its_listener(self):
+        other_shop_id = self.app.post(
+            "/shop/", json={"name": "other", "address": "address"}
+        ).json["id"]
+        cache_listener.start()
+        with patch.object(cache_listener, "PRICE_INDEX_MAX_LISTENERS", 1):
+            self.prices(f"/shop/{self.shop_id}/products?min_price=15")
+            self.assertTrue(price_indexes.is_watched(f"shops/{self.shop_id}/products"))
+            self.prices(f"/shop/{other_shop_id}/products?min_price=15")
+        self.assertFalse(price_indexes.is_watched(f"shops/{self.shop_id}/products"))
+        self.assertIsNone(price_indexes.get(f"shops/{self.shop_id}/products"))
+        self.assertTrue(price_indexes.is_watched(f"shops/{other_shop_id}/products"))
+        self.assertEqual(len(cache_listener._collection_watches), 1)
@@ -1,7 +1,11 @@
 import unittest
+from unittest.mock import patch
 from src.app import app
+from src import documents
+from src.documents import FIRESTORE_TRANSACTIONAL_UPDATES_ENABLED, rpc_count
 from test.common_utilities import delete_all_documents
 
+import json
 import random
 
 
@@ -94,6 +98,52 @@ class TestProductsEndpointWithPriceFilters(unittest.TestCase):
         delete_all_documents()
         return super().tearDown()
 
+    def test_get_products_with_price_filter_twice_is_served_from_cache(self):
+        self.app.get("/products/?min_price=20")
+        with self.app:
+            response = self.app.get("/products/?min_price=20")
+            self.assertEqual(len(response.json), 3)
+            self.assertEqual(rpc_count(), 0)
+
+    def test_only_plain_price_ranges_are_cached(self):
+        for url in ["/products/", "/products/?min_price=20&fields=name"]:
+            with self.subTest(url):
+                self.app.get(url)
+                with self.app:
+                    self.app.get(url)
+                    self.assertEqual(rpc_count(), 1)
+
+    def test_post_during_a_cached_query_is_not_hidden(self):
+        query = documents.get_query
+        raced = []
+
+        # the query is overtaken by a write before its result reaches the cache
+        def query_then_write(*args):
+            snapshots = query(*args)
+            if not raced:
+                raced.append(True)
+                app.test_client().post(
+                    "/products/",
+                    json={"name": "40", "description": "40 quid product", "price": 40},
+                )
+            return snapshots
+
+        with patch("src.documents.get_query", side_effect=query_then_write):
+            response = self.app.get("/products/?min_price=20")
+        self.assertEqual(len(response.json), 3)
+
+        response = self.app.get("/products/?min_price=20")
+        self.assertEqual(len(response.json), 4)
+
+    def test_get_products_with_price_filter_after_post(self):
+        self.app.get("/products/?min_price=20")
+        self.app.post(
+            "/products/",
+            json={"name": "40", "description": "40 quid product", "price": 40},
+        )
+        response = self.app.get("/products/?min_price=20")
+        self.assertEqual(len(response.json), 4)
+
     def test_get_products_with_min_price_filter(self):
         response = self.app.get("/products/?min_price=20")
         self.assertEqual(response.status_code, 200)
@@ -182,3 +232,482 @@ class TestProductsEndpointsWithProductId(unittest.TestCase):
     def test_delete_product_by_invalid_id(self):
         response = self.app.delete("/products/invalid-id")
         self.assertEqual(response.status_code, 404)
+
+
+class TestProductsCachedLookupRacingAWrite(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/",
+            json={"name": "racy", "description": "racy product", "price": 5},
+        )
+        self.product_id = response.json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_write_during_a_cached_lookup_is_not_hidden(self):
+        read = documents.get_document
+        raced = []
+
+        # the first read is overtaken by a write before it reaches the cache
+        def read_then_write(reference):
+            snapshot = read(reference)
+            if not raced:
+                raced.append(reference.path)
+                self.assertEqual(
+                    app.test_client()
+                    .put(f"/products/{self.product_id}", json={"price": 9})
+                    .status_code,
+                    200,
+                )
+            return snapshot
+
+        with patch("src.documents.get_document", side_effect=read_then_write):
+            response = self.app.get(f"/products/{self.product_id}")
+        self.assertEqual(response.json["price"], 5)
+        self.assertEqual(raced, [f"products/{self.product_id}"])
+
+        response = self.app.get(f"/products/{self.product_id}")
+        self.assertEqual(response.json["price"], 9)
+
+
+class TestProductsEndpointsRpcCount(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = response.json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_product_by_id_rpc_count(self):
+        with self.app:
+            self.app.get(f"/products/{self.product_id}")
+            self.assertEqual(rpc_count(), 1)
+
+    def test_get_product_by_id_twice_is_served_from_cache(self):
+        self.app.get(f"/products/{self.product_id}")
+        with self.app:
+            response = self.app.get(f"/products/{self.product_id}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["name"], random_product_name)
+            self.assertEqual(rpc_count(), 0)
+
+    def test_update_product_by_id_rpc_count(self):
+        with self.app, patch.dict(
+            app.config, {"FIRESTORE_TRANSACTIONAL_UPDATES": False}
+        ):
+            self.app.put(
+                f"/products/{self.product_id}",
+                json={
+                    "name": random_product_name + "new",
+                    "description": random_product_description + "new",
+                    "price": random_product_price + 10,
+                },
+            )
+            # read, update and the lookup of the copies stocked by shops
+            self.assertEqual(rpc_count(), 3)
+
+    def test_delete_product_by_id_rpc_count(self):
+        with self.app:
+            self.app.delete(f"/products/{self.product_id}")
+            self.assertEqual(rpc_count(), 2)
+
+
+class TestProductsEndpointsWithTransactionalUpdates(unittest.TestCase):
+    def setUp(self):
+        app.config["FIRESTORE_TRANSACTIONAL_UPDATES"] = True
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = response.json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        app.config["FIRESTORE_TRANSACTIONAL_UPDATES"] = (
+            FIRESTORE_TRANSACTIONAL_UPDATES_ENABLED
+        )
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_update_product_by_id(self):
+        with self.app:
+            response = self.app.put(
+                f"/products/{self.product_id}",
+                json={
+                    "name": random_product_name + "new",
+                    "price": random_product_price + 10,
+                },
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rpc_count(), 4)
+        with self.subTest():
+            response = self.app.get(f"/products/{self.product_id}")
+            self.assertEqual(response.json["name"], random_product_name + "new")
+            self.assertEqual(response.json["description"], random_product_description)
+            self.assertEqual(response.json["price"], random_product_price + 10)
+
+    def test_update_product_by_invalid_id(self):
+        response = self.app.put("/products/invalid-id", json={"price": 1})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestProductsEndpointWithPagination(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        for price in [10, 20, 25, 30]:
+            self.app.post(
+                "/products/",
+                json={
+                    "name": str(price),
+                    "description": f"{price} quid product",
+                    "price": price,
+                },
+            )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_products_pages(self):
+        response = self.app.get("/products/?limit=3&order_by=price")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product["price"] for product in response.json], [10, 20, 25])
+        token = response.headers["X-Next-Page-Token"]
+
+        with self.subTest("second page"):
+            response = self.app.get(
+                f"/products/?limit=3&order_by=price&start_after={token}"
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([product["price"] for product in response.json], [30])
+            self.assertNotIn("X-Next-Page-Token", response.headers)
+
+    def test_get_products_pages_descending_with_price_filter(self):
+        response = self.app.get("/products/?limit=2&order_by=-price&min_price=20")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product["price"] for product in response.json], [30, 25])
+
+    def test_get_products_with_fields(self):
+        response = self.app.get("/products/?fields=name")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 4)
+        for product in response.json:
+            self.assertEqual(list(product.keys()), ["name"])
+
+    def test_get_products_streamed(self):
+        response = self.app.get("/products/?stream=1&min_price=20")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        products = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual([product["price"] for product in products], [20, 25, 30])
+
+    def test_get_products_streamed_with_accept_header(self):
+        response = self.app.get(
+            "/products/", headers={"Accept": "application/x-ndjson"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(len(response.data.splitlines()), 4)
+
+    def test_get_products_with_invalid_page_token(self):
+        response = self.app.get("/products/?limit=2&start_after=invalid")
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_products_with_invalid_limit(self):
+        response = self.app.get("/products/?limit=0")
+        self.assertEqual(response.status_code, 400)
+
+
+class TestProductsBatchEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_post_products_batch(self):
+        products = [
+            {"name": str(price), "description": f"{price} quid product", "price": price}
+            for price in [10, 20, 30]
+        ]
+        with self.app:
+            response = self.app.post("/products/batch", json=products)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json), 3)
+            self.assertEqual(rpc_count(), 1)
+
+        for product, result in zip(products, response.json):
+            with self.subTest(product=product["name"]):
+                response = self.app.get(f"/products/{result['id']}")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json, product)
+
+    def test_post_products_batch_raises_key_error(self):
+        response = self.app.post(
+            "/products/batch",
+            json=[
+                {"name": "10", "description": "10 quid product", "price": 10},
+                {"name": "20"},
+            ],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json[0]["index"], 1)
+
+        with self.subTest("nothing is written"):
+            response = self.app.get("/products/")
+            self.assertEqual(response.json, [])
+
+    def test_post_products_batch_requires_a_list(self):
+        response = self.app.post("/products/batch", json={})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestProductsLookupEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/batch",
+            json=[
+                {
+                    "name": str(price),
+                    "description": f"{price} quid product",
+                    "price": price,
+                }
+                for price in [10, 20, 30]
+            ],
+        )
+        self.product_ids = [result["id"] for result in response.json]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_products_by_ids(self):
+        ids = [self.product_ids[2], "invalid-id", self.product_ids[0]]
+        with self.app:
+            response = self.app.get(f"/products/?ids={','.join(ids)}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rpc_count(), 1)
+        self.assertEqual(
+            [product["id"] for product in response.json["products"]],
+            [self.product_ids[2], self.product_ids[0]],
+        )
+        self.assertEqual(response.json["products"][0]["price"], 30)
+        self.assertEqual(response.json["missing"], ["invalid-id"])
+
+    def test_post_products_lookup(self):
+        response = self.app.post("/products/lookup", json={"ids": self.product_ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [product["price"] for product in response.json["products"]], [10, 20, 30]
+        )
+        self.assertEqual(response.json["missing"], [])
+
+    def test_post_products_lookup_requires_ids(self):
+        response = self.app.post("/products/lookup", json={})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestProductsConditionalRequests(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = response.json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_product_sends_validators(self):
+        response = self.app.get(f"/products/{self.product_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.headers.get("ETag"))
+        self.assertIsNotNone(response.headers.get("Last-Modified"))
+
+    def test_get_product_with_current_etag(self):
+        etag = self.app.get(f"/products/{self.product_id}").headers["ETag"]
+        with self.app:
+            response = self.app.get(
+                f"/products/{self.product_id}", headers={"If-None-Match": etag}
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+            self.assertEqual(rpc_count(), 0)
+
+    def test_get_product_with_stale_etag(self):
+        etag = self.app.get(f"/products/{self.product_id}").headers["ETag"]
+        self.app.put(f"/products/{self.product_id}", json={"price": 1})
+        response = self.app.get(
+            f"/products/{self.product_id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json["price"], 1)
+
+    def test_get_product_modified_since(self):
+        last_modified = self.app.get(f"/products/{self.product_id}").headers[
+            "Last-Modified"
+        ]
+        response = self.app.get(
+            f"/products/{self.product_id}",
+            headers={"If-Modified-Since": last_modified},
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class TestProductsIfMatch(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = response.json["id"]
+        self.etag = self.app.get(f"/products/{self.product_id}").headers["ETag"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_update_product_with_current_etag(self):
+        with self.app:
+            response = self.app.put(
+                f"/products/{self.product_id}",
+                json={"price": 1},
+                headers={"If-Match": self.etag},
+            )
+            self.assertEqual(response.status_code, 200)
+            # the update and the lookup of shop copies, the product is not read
+            self.assertEqual(rpc_count(), 2)
+
+    def test_update_product_with_stale_etag(self):
+        self.app.put(f"/products/{self.product_id}", json={"price": 1})
+        response = self.app.put(
+            f"/products/{self.product_id}",
+            json={"price": 2},
+            headers={"If-Match": self.etag},
+        )
+        self.assertEqual(response.status_code, 412)
+        response = self.app.get(f"/products/{self.product_id}")
+        self.assertEqual(response.json["price"], 1)
+
+    def test_update_product_with_invalid_etag(self):
+        response = self.app.put(
+            f"/products/{self.product_id}",
+            json={"price": 2},
+            headers={"If-Match": '"not-an-etag"'},
+        )
+        self.assertEqual(response.status_code, 412)
+
+    def test_update_product_with_any_etag(self):
+        response = self.app.put(
+            f"/products/{self.product_id}",
+            json={"price": 2},
+            headers={"If-Match": "*"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_product_with_stale_etag(self):
+        self.app.put(f"/products/{self.product_id}", json={"price": 1})
+        response = self.app.delete(
+            f"/products/{self.product_id}", headers={"If-Match": self.etag}
+        )
+        self.assertEqual(response.status_code, 412)
+        etag = self.app.get(f"/products/{self.product_id}").headers["ETag"]
+        response = self.app.delete(
+            f"/products/{self.product_id}", headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.app.get(f"/products/{self.product_id}")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestProductsStatsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        for price in [10, 20, 25, 30]:
+            self.app.post(
+                "/products/",
+                json={"name": str(price), "description": "product", "price": price},
+            )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_products_stats(self):
+        with self.app:
+            response = self.app.get("/products/stats")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json, {"count": 4, "sum": 85, "average": 21.25})
+            self.assertEqual(rpc_count(), 1)
+
+    def test_get_products_stats_with_price_filters(self):
+        response = self.app.get("/products/stats?min_price=20&max_price=25")
+        self.assertEqual(response.json, {"count": 2, "sum": 45, "average": 22.5})
+        response = self.app.get("/products/stats?min_price=100")
+        self.assertEqual(response.json, {"count": 0, "sum": 0, "average": None})
+
+    def test_get_products_stats_invalid_price_filter(self):
+        response = self.app.get("/products/stats?min_price=cheap")
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_products_stats_cached(self):
+        self.app.get("/products/stats?cached=1&min_price=20")
+        with self.app:
+            response = self.app.get("/products/stats?cached=1&min_price=20")
+            self.assertEqual(response.json["count"], 3)
+            self.assertEqual(rpc_count(), 0)
+        self.app.post(
+            "/products/",
+            json={"name": "40", "description": "product", "price": 40},
+        )
+        response = self.app.get("/products/stats?cached=1&min_price=20")
+        self.assertEqual(response.json["count"], 4)
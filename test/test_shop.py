@@ -1,8 +1,17 @@
 import unittest
+from unittest.mock import patch
+from google.api_core.exceptions import ServiceUnavailable
 from src.app import app
+from src import async_firestore_db, products
+from src.documents import rpc_count
+from src.cache import query_cache
+from src.firestore_db import firestore_db
 from test.common_utilities import delete_all_documents
 
+import json
 import random
+import threading
+import time
 
 random_shop_name = "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=10))
 random_shop_address = "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=100))
@@ -46,6 +55,76 @@ class TestShopEndpoints(unittest.TestCase):
             self.assertEqual(response.json["address"], random_shop_address)
 
 
+class TestShopEndpointWithPagination(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        for name in ["a", "b", "c", "d", "e"]:
+            self.app.post("/shop/", json={"name": name, "address": f"{name} street"})
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_shops_pages(self):
+        names = []
+        token = None
+        for expected in [["a", "b"], ["c", "d"], ["e"]]:
+            url = "/shop/?limit=2&order_by=name"
+            if token is not None:
+                url += f"&start_after={token}"
+            response = self.app.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([shop["name"] for shop in response.json], expected)
+            names.extend(shop["name"] for shop in response.json)
+            token = response.headers.get("X-Next-Page-Token")
+        self.assertIsNone(token)
+        self.assertEqual(names, ["a", "b", "c", "d", "e"])
+
+    def test_get_shops_pages_without_order_by(self):
+        first = self.app.get("/shop/?limit=3")
+        self.assertEqual(first.status_code, 200)
+        token = first.headers["X-Next-Page-Token"]
+
+        with self.subTest("second page"):
+            second = self.app.get(f"/shop/?limit=3&start_after={token}")
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(len(second.json), 2)
+            self.assertNotIn("X-Next-Page-Token", second.headers)
+            self.assertEqual(
+                sorted(shop["name"] for shop in first.json + second.json),
+                ["a", "b", "c", "d", "e"],
+            )
+
+    def test_get_shops_pages_descending(self):
+        response = self.app.get("/shop/?limit=2&order_by=-name")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([shop["name"] for shop in response.json], ["e", "d"])
+        token = response.headers["X-Next-Page-Token"]
+
+        with self.subTest("second page"):
+            response = self.app.get(
+                f"/shop/?limit=2&order_by=-name&start_after={token}"
+            )
+            self.assertEqual([shop["name"] for shop in response.json], ["c", "b"])
+
+    def test_get_shops_with_fields(self):
+        response = self.app.get("/shop/?fields=name&order_by=name")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([shop["name"] for shop in response.json], list("abcde"))
+        for shop in response.json:
+            self.assertEqual(list(shop.keys()), ["name"])
+
+    def test_get_shops_with_invalid_page_token(self):
+        response = self.app.get("/shop/?limit=2&start_after=invalid")
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_shops_with_invalid_limit(self):
+        response = self.app.get("/shop/?limit=0")
+        self.assertEqual(response.status_code, 400)
+
+
 class TestShopEndpointsWithShopId(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
@@ -273,6 +352,16 @@ class TestShopEndpointGettingProductsInShopWithPriceFilters(unittest.TestCase):
         self.assertEqual(response.json[0]["price"], 10)
         self.assertEqual(response.json[1]["price"], 20)
 
+    def test_get_shop_products_streamed(self):
+        response = self.app.get(
+            f"/shop/{self.shop_id}/products/?max_price=20",
+            headers={"Accept": "application/x-ndjson"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        products = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual([product["price"] for product in products], [10, 20])
+
     def test_get_shop_products_with_min_and_max_price_filter(self):
         response = self.app.get(
             f"/shop/{self.shop_id}/products/?min_price=20&max_price=25"
@@ -336,6 +425,63 @@ class TestShopEndpointEditingProductsInShop(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.json["quantity"], quantity)
 
+    def test_update_product_is_propagated_to_shop(self):
+        response = self.app.put(
+            f"/products/{self.product_id}",
+            json={
+                "name": random_product_name + "new",
+                "price": random_product_price + 1,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.app.get(f"/shop/{self.shop_id}/products/{self.product_id}")
+        self.assertEqual(response.json["name"], random_product_name + "new")
+        self.assertEqual(response.json["price"], random_product_price + 1)
+        self.assertEqual(response.json["description"], random_product_description)
+        self.assertEqual(response.json["quantity"], 1)
+
+    def test_update_product_skips_copies_removed_during_propagation(self):
+        other_shop_id = self.app.post(
+            "/shop/", json={"name": "other", "address": "other street"}
+        ).json["id"]
+        self.app.post(f"/shop/{other_shop_id}/products/{self.product_id}", json={})
+        query = products.get_query
+
+        # the copy in this shop is deleted once the copies were looked up
+        def query_then_delete(*args):
+            copies = query(*args)
+            firestore_db.collection("shops").document(self.shop_id).collection(
+                "products"
+            ).document(self.product_id).delete()
+            return copies
+
+        with patch("src.products.get_query", side_effect=query_then_delete):
+            response = self.app.put(
+                f"/products/{self.product_id}", json={"name": "renamed"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"id": self.product_id})
+
+        response = self.app.get(f"/shop/{other_shop_id}/products/{self.product_id}")
+        self.assertEqual(response.json["name"], "renamed")
+        response = self.app.get(f"/shop/{self.shop_id}/products/{self.product_id}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_product_reports_failed_propagation(self):
+        with patch(
+            "src.products.update_documents",
+            side_effect=ServiceUnavailable("firestore is down"),
+        ):
+            response = self.app.put(
+                f"/products/{self.product_id}", json={"name": "renamed"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["id"], self.product_id)
+        self.assertIn("firestore is down", response.json["propagation_error"])
+        response = self.app.get(f"/products/{self.product_id}")
+        self.assertEqual(response.json["name"], "renamed")
+
     def test_update_shop_products_details_invalid_shop_id(self):
         response = self.app.put(
             f"/shop/invalid_id/products/{self.product_id}",
@@ -378,3 +524,599 @@ class TestShopEndpointEditingProductsInShop(unittest.TestCase):
         with self.subTest():
             response = self.app.get(f"/shop/{self.shop_id}/products/{self.product_id}")
             self.assertEqual(response.status_code, 404)
+
+
+class TestShopEndpointsRpcCount(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        product_response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = product_response.json["id"]
+        shop_response = self.app.post(
+            "/shop/",
+            json={
+                "name": random_shop_name,
+                "address": random_shop_address,
+            },
+        )
+        self.shop_id = shop_response.json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_post_shop_products_rpc_count(self):
+        with self.app:
+            self.app.post(
+                f"/shop/{self.shop_id}/products/{self.product_id}",
+                json={"quantity": 1},
+            )
+            self.assertEqual(rpc_count(), 2)
+
+    def test_get_shop_products_by_specific_product_id_rpc_count(self):
+        self.app.post(
+            f"/shop/{self.shop_id}/products/{self.product_id}",
+            json={"quantity": 1},
+        )
+        with self.app:
+            self.app.get(f"/shop/{self.shop_id}/products/{self.product_id}")
+            self.assertEqual(rpc_count(), 1)
+
+    # with FIRESTORE_BACKEND=memory this covers the get_all fallback of the
+    # async lookups, the gathered lookups are tested in test_firestore_db
+    def test_post_shop_products_with_async_lookups(self):
+        async_firestore_db.FIRESTORE_ASYNC_ENABLED = True
+        try:
+            with self.app:
+                response = self.app.post(
+                    f"/shop/{self.shop_id}/products/{self.product_id}",
+                    json={"quantity": 3},
+                )
+                self.assertEqual(response.status_code, 200)
+                # three concurrent lookups and the write, or one get_all and
+                # the write with the fallback
+                self.assertEqual(
+                    rpc_count(),
+                    2 if async_firestore_db.FIRESTORE_BACKEND == "memory" else 4,
+                )
+            response = self.app.get(f"/shop/{self.shop_id}/products/{self.product_id}")
+            self.assertEqual(response.json["quantity"], 3)
+        finally:
+            async_firestore_db.FIRESTORE_ASYNC_ENABLED = False
+
+    def test_get_shop_products_rpc_count(self):
+        with self.app:
+            self.app.get(f"/shop/{self.shop_id}/products")
+            self.assertEqual(rpc_count(), 2)
+
+
+class TestShopProductsBatchEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/batch",
+            json=[
+                {
+                    "name": str(price),
+                    "description": f"{price} quid product",
+                    "price": price,
+                }
+                for price in [10, 20]
+            ],
+        )
+        self.product_ids = [result["id"] for result in response.json]
+        shop_response = self.app.post(
+            "/shop/",
+            json={
+                "name": random_shop_name,
+                "address": random_shop_address,
+            },
+        )
+        self.shop_id = shop_response.json["id"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_post_shop_products_batch(self):
+        with self.app:
+            response = self.app.post(
+                f"/shop/{self.shop_id}/products/batch",
+                json=[
+                    {"product_id": self.product_ids[0], "quantity": 5},
+                    {"product_id": self.product_ids[1]},
+                    {"product_id": "invalid_id"},
+                ],
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rpc_count(), 4)
+        self.assertEqual(
+            [result["status"] for result in response.json], [200, 200, 404]
+        )
+
+        with self.subTest():
+            response = self.app.get(f"/shop/{self.shop_id}/products")
+            self.assertEqual(
+                sorted(product["quantity"] for product in response.json), [1, 5]
+            )
+
+        with self.subTest("already in shop"):
+            response = self.app.post(
+                f"/shop/{self.shop_id}/products/batch",
+                json=[{"product_id": self.product_ids[0]}],
+            )
+            self.assertEqual(response.json[0]["status"], 400)
+
+    def test_post_shop_products_batch_duplicate_product_id(self):
+        response = self.app.post(
+            f"/shop/{self.shop_id}/products/batch",
+            json=[
+                {"product_id": self.product_ids[0]},
+                {"product_id": self.product_ids[0]},
+            ],
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_shop_products_batch_invalid_shop_id(self):
+        response = self.app.post(
+            "/shop/invalid_id/products/batch",
+            json=[{"product_id": self.product_ids[0]}],
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class TestShopEndpointDeletingShopWithProducts(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        response = self.app.post(
+            "/products/batch",
+            json=[
+                {
+                    "name": str(price),
+                    "description": f"{price} quid product",
+                    "price": price,
+                }
+                for price in [10, 20, 30]
+            ],
+        )
+        product_ids = [result["id"] for result in response.json]
+        shop_response = self.app.post(
+            "/shop/",
+            json={
+                "name": random_shop_name,
+                "address": random_shop_address,
+            },
+        )
+        self.shop_id = shop_response.json["id"]
+        self.app.post(
+            f"/shop/{self.shop_id}/products/batch",
+            json=[{"product_id": product_id} for product_id in product_ids],
+        )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def shop_products_left(self):
+        return (
+            firestore_db.collection("shops")
+            .document(self.shop_id)
+            .collection("products")
+            .get()
+        )
+
+    def test_delete_shop_deletes_its_products(self):
+        response = self.app.delete(f"/shop/{self.shop_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shop_products_left(), [])
+
+    def test_delete_shop_in_background(self):
+        response = self.app.delete(f"/shop/{self.shop_id}?background=1")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.headers["Location"], f"/shop/{self.shop_id}/deletion")
+
+        for _ in range(50):
+            response = self.app.get(f"/shop/{self.shop_id}/deletion")
+            if response.json["status"] != "running":
+                break
+            time.sleep(0.1)
+        self.assertEqual(response.json["status"], "done")
+        self.assertEqual(response.json["deleted"], 4)
+        self.assertEqual(self.shop_products_left(), [])
+
+        with self.subTest():
+            response = self.app.get(f"/shop/{self.shop_id}")
+            self.assertEqual(response.status_code, 404)
+
+    def test_get_shop_deletion_without_deletion(self):
+        response = self.app.get(f"/shop/{self.shop_id}/deletion")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestShopConditionalRequests(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        product_response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = product_response.json["id"]
+        shop_response = self.app.post(
+            "/shop/",
+            json={
+                "name": random_shop_name,
+                "address": random_shop_address,
+            },
+        )
+        self.shop_id = shop_response.json["id"]
+        self.app.post(
+            f"/shop/{self.shop_id}/products/{self.product_id}",
+            json={"quantity": 1},
+        )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_shop_with_current_etag(self):
+        etag = self.app.get(f"/shop/{self.shop_id}").headers["ETag"]
+        response = self.app.get(
+            f"/shop/{self.shop_id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_shop_product_with_current_etag(self):
+        url = f"/shop/{self.shop_id}/products/{self.product_id}"
+        etag = self.app.get(url).headers["ETag"]
+        response = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_shop_products_with_current_etag(self):
+        url = f"/shop/{self.shop_id}/products"
+        etag = self.app.get(url).headers["ETag"]
+        with self.app:
+            response = self.app.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            # the shop is cached, only the update times of the listing are read
+            self.assertEqual(rpc_count(), 1)
+
+    def test_get_shop_products_with_if_modified_since(self):
+        url = f"/shop/{self.shop_id}/products"
+        modified = self.app.get(url).headers["Last-Modified"]
+        with self.app:
+            response = self.app.get(url, headers={"If-Modified-Since": modified})
+            # listings ignore If-Modified-Since, so only the listing is read
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rpc_count(), 1)
+
+    def test_get_shop_products_in_price_range_with_current_etag(self):
+        url = f"/shop/{self.shop_id}/products?min_price=1"
+        etag = self.app.get(url).headers["ETag"]
+        with self.app:
+            response = self.app.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            # the shop and the price range are both cached
+            self.assertEqual(rpc_count(), 0)
+
+    def test_get_shop_products_etag_changes_with_products(self):
+        url = f"/shop/{self.shop_id}/products"
+        etag = self.app.get(url).headers["ETag"]
+        self.app.put(
+            f"/shop/{self.shop_id}/products/{self.product_id}", json={"quantity": 5}
+        )
+        response = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.app.delete(f"/shop/{self.shop_id}/products/{self.product_id}")
+        response = self.app.get(
+            url, headers={"If-None-Match": response.headers["ETag"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+
+    def test_get_shop_products_with_current_etag_after_cache_expiry(self):
+        url = f"/shop/{self.shop_id}/products"
+        etag = self.app.get(url).headers["ETag"]
+        query_cache.clear()
+        with self.app:
+            response = self.app.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            # only the update times are read
+            self.assertEqual(rpc_count(), 1)
+
+
+class TestShopProductsIfMatch(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        product_response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = product_response.json["id"]
+        shop_response = self.app.post(
+            "/shop/",
+            json={
+                "name": random_shop_name,
+                "address": random_shop_address,
+            },
+        )
+        self.shop_id = shop_response.json["id"]
+        self.url = f"/shop/{self.shop_id}/products/{self.product_id}"
+        self.app.post(self.url, json={"quantity": 1})
+        self.etag = self.app.get(self.url).headers["ETag"]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_update_quantity_with_current_etag(self):
+        response = self.app.put(
+            self.url, json={"quantity": 2}, headers={"If-Match": self.etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.app.get(self.url).json["quantity"], 2)
+
+    def test_concurrent_quantity_updates_with_the_same_etag(self):
+        first = self.app.put(
+            self.url, json={"quantity": 2}, headers={"If-Match": self.etag}
+        )
+        second = self.app.put(
+            self.url, json={"quantity": 3}, headers={"If-Match": self.etag}
+        )
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 412)
+        self.assertEqual(self.app.get(self.url).json["quantity"], 2)
+
+    def test_delete_with_stale_etag(self):
+        self.app.put(self.url, json={"quantity": 2})
+        response = self.app.delete(self.url, headers={"If-Match": self.etag})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.app.get(self.url).status_code, 200)
+
+
+class TestShopProductAdjustEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        product_response = self.app.post(
+            "/products/",
+            json={
+                "name": random_product_name,
+                "description": random_product_description,
+                "price": random_product_price,
+            },
+        )
+        self.product_id = product_response.json["id"]
+        shop_response = self.app.post(
+            "/shop/",
+            json={
+                "name": random_shop_name,
+                "address": random_shop_address,
+            },
+        )
+        self.shop_id = shop_response.json["id"]
+        self.url = f"/shop/{self.shop_id}/products/{self.product_id}"
+        self.app.post(self.url, json={"quantity": 5})
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_adjust_quantity(self):
+        with self.app:
+            response = self.app.post(f"{self.url}/adjust", json={"delta": -2})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json, {"id": self.product_id, "quantity": 3})
+            # the shop lookup and the increment, the product is not read
+            self.assertEqual(rpc_count(), 2)
+        self.assertEqual(self.app.get(self.url).json["quantity"], 3)
+
+    def test_adjust_quantity_without_floor_can_go_negative(self):
+        response = self.app.post(f"{self.url}/adjust", json={"delta": -7})
+        self.assertEqual(response.json["quantity"], -2)
+
+    def test_adjust_quantity_below_floor(self):
+        response = self.app.post(f"{self.url}/adjust", json={"delta": -6, "floor": 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.app.get(self.url).json["quantity"], 5)
+        response = self.app.post(f"{self.url}/adjust", json={"delta": -5, "floor": 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["quantity"], 0)
+
+    def test_concurrent_adjustments_respect_floor(self):
+        statuses = []
+
+        def checkout():
+            response = app.test_client().post(
+                f"{self.url}/adjust", json={"delta": -1, "floor": 0}
+            )
+            statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses.count(200), 5)
+        self.assertEqual(statuses.count(409), 3)
+        self.assertEqual(self.app.get(self.url).json["quantity"], 0)
+
+    def test_adjust_quantity_invalid_delta(self):
+        for body in [{}, {"delta": "1"}, {"delta": 1.5}, {"delta": 1, "floor": "0"}]:
+            response = self.app.post(f"{self.url}/adjust", json=body)
+            self.assertEqual(response.status_code, 400)
+
+    def test_adjust_quantity_invalid_ids(self):
+        response = self.app.post(
+            f"/shop/{self.shop_id}/products/invalid_id/adjust", json={"delta": 1}
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.app.post(
+            f"/shop/invalid_id/products/{self.product_id}/adjust", json={"delta": 1}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class TestCrossShopProductSearch(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        self.shop_ids = [
+            self.app.post(
+                "/shop/", json={"name": name, "address": random_shop_address}
+            ).json["id"]
+            for name in ["first", "second", "third"]
+        ]
+        self.product_ids = [
+            self.app.post(
+                "/products/",
+                json={"name": str(price), "description": "product", "price": price},
+            ).json["id"]
+            for price in [10, 20]
+        ]
+        for shop_id in self.shop_ids[:2]:
+            for product_id in self.product_ids:
+                self.app.post(
+                    f"/shop/{shop_id}/products/{product_id}", json={"quantity": 1}
+                )
+        self.app.post(
+            f"/shop/{self.shop_ids[2]}/products/{self.product_ids[0]}",
+            json={"quantity": 1},
+        )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_shops_stocking_product(self):
+        response = self.app.get(f"/products/{self.product_ids[0]}/shops")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(copy["shop_id"] for copy in response.json), sorted(self.shop_ids)
+        )
+        response = self.app.get(f"/products/{self.product_ids[1]}/shops")
+        self.assertEqual(
+            sorted(copy["shop_id"] for copy in response.json),
+            sorted(self.shop_ids[:2]),
+        )
+        self.assertEqual(response.json[0]["price"], 20)
+
+    def test_get_shops_stocking_product_under_max_price(self):
+        response = self.app.get(f"/products/{self.product_ids[1]}/shops?max_price=15")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+        response = self.app.get(f"/products/{self.product_ids[0]}/shops?max_price=15")
+        self.assertEqual(len(response.json), 3)
+
+    def test_get_shops_stocking_unknown_product(self):
+        response = self.app.get("/products/invalid_id/shops")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+
+    def test_product_put_refuses_fields_of_shop_products(self):
+        response = self.app.put(
+            f"/products/{self.product_ids[0]}", json={"product_id": "zz"}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.app.put(
+            f"/products/{self.product_ids[0]}", json={"quantity": 1}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_catalogue_product_with_product_id_is_skipped(self):
+        # written before product ids were refused on catalogue products
+        firestore_db.collection("products").document(self.product_ids[0]).update(
+            {"product_id": "zz"}
+        )
+        response = self.app.get("/shop-products/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 5)
+        response = self.app.get("/products/zz/shops")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+
+    def test_get_shop_products_across_shops(self):
+        response = self.app.get("/shop-products/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 5)
+        response = self.app.get("/shop-products/?min_price=15")
+        self.assertEqual([copy["price"] for copy in response.json], [20, 20])
+        response = self.app.get(f"/shop-products/?product_id={self.product_ids[0]}")
+        self.assertEqual(len(response.json), 3)
+        response = self.app.get("/shop-products/?max_price=15&limit=2")
+        self.assertEqual([copy["price"] for copy in response.json], [10, 10])
+
+    def test_get_shop_products_across_shops_invalid_filters(self):
+        for query in ["min_price=cheap", "max_price=", "limit=0", "limit=-1"]:
+            response = self.app.get(f"/shop-products/?{query}")
+            self.assertEqual(response.status_code, 400)
+
+
+class TestShopProductsStatsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        delete_all_documents()
+        self.shop_id = self.app.post(
+            "/shop/", json={"name": random_shop_name, "address": random_shop_address}
+        ).json["id"]
+        for price in [10, 20, 30]:
+            product_id = self.app.post(
+                "/products/",
+                json={"name": str(price), "description": "product", "price": price},
+            ).json["id"]
+            self.app.post(
+                f"/shop/{self.shop_id}/products/{product_id}", json={"quantity": 1}
+            )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        delete_all_documents()
+        return super().tearDown()
+
+    def test_get_shop_products_stats(self):
+        response = self.app.get(f"/shop/{self.shop_id}/products/stats?max_price=20")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"count": 2, "sum": 30, "average": 15.0})
+
+    def test_get_shop_products_stats_cached_after_write(self):
+        url = f"/shop/{self.shop_id}/products/stats?cached=1"
+        self.assertEqual(self.app.get(url).json["count"], 3)
+        product_id = self.app.post(
+            "/products/", json={"name": "40", "description": "product", "price": 40}
+        ).json["id"]
+        self.app.post(
+            f"/shop/{self.shop_id}/products/{product_id}", json={"quantity": 1}
+        )
+        with self.app:
+            self.assertEqual(self.app.get(url).json["count"], 4)
+            self.assertEqual(rpc_count(), 1)
+
+    def test_get_shop_products_stats_invalid_shop_id(self):
+        response = self.app.get("/shop/invalid_id/products/stats")
+        self.assertEqual(response.status_code, 404)